@@ -12,7 +12,7 @@ echo ""
 python3 --version || { echo "Error: Python 3 required"; exit 1; }
 
 echo "[1/4] Installing TEE server dependencies..."
-pip3 install flask cryptography pyjwt requests
+pip3 install flask cryptography pyjwt requests orjson waitress pybase64
 
 echo ""
 echo "[2/4] Starting TEE Server..."
@@ -4,6 +4,8 @@ Configuration settings for the Flask application
 import os
 from datetime import timedelta
 
+from sqlalchemy.pool import StaticPool
+
 
 class Config:
     """Base configuration"""
@@ -61,6 +63,11 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # In-memory SQLite for fast tests
+    # One shared connection keeps the in-memory database alive across threads
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': StaticPool,
+        'connect_args': {'check_same_thread': False},
+    }
     WTF_CSRF_ENABLED = False
     SERVER_NAME = 'localhost.localdomain'
 
@@ -1,7 +1,7 @@
 """
 API Key model
 """
-from datetime import datetime
+from datetime import datetime, timedelta
 import secrets
 from app.extensions import db
 
@@ -10,6 +10,13 @@ class APIKey(db.Model):
     """API Key model for external API access"""
     __tablename__ = 'api_keys'
     
+    # last_used is only shown at day granularity, so don't commit on every request
+    LAST_USED_UPDATE_INTERVAL = timedelta(minutes=1)
+    
+    # generate_key() produces 64 characters; the column can't hold more
+    MIN_KEY_LENGTH = 40
+    MAX_KEY_LENGTH = 64
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     key = db.Column(db.String(64), unique=True, nullable=False, index=True)
@@ -44,8 +51,13 @@ class APIKey(db.Model):
     @classmethod
     def get_user_by_api_key(cls, key):
         """Get user associated with an active API key"""
+        if not key or not cls.MIN_KEY_LENGTH <= len(key) <= cls.MAX_KEY_LENGTH:
+            return None
+        
         api_key = cls.get_by_key(key)
         if api_key:
-            api_key.mark_used()
+            if (api_key.last_used is None or
+                    datetime.utcnow() - api_key.last_used >= cls.LAST_USED_UPDATE_INTERVAL):
+                api_key.mark_used()
             return api_key.user
         return None
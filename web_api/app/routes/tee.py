@@ -150,6 +150,13 @@ def delete_session(session_id):
         # Close the session (no VM to terminate with shared TEE)
         session.close()
         
+        # Free the session's datasets and database in the shared TEE
+        try:
+            GCPTEEService().close_session(session_id)
+        except Exception as e:
+            # Log warning but don't fail - the session is already closed
+            logger.warning(f"Could not release session {session_id} in shared TEE: {e}")
+        
         return jsonify({
             'message': 'Session closed successfully',
             'session_id': session_id
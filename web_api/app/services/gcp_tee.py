@@ -584,6 +584,48 @@ class GCPTEEService:
             logger.error(f"Failed to list datasets from TEE: {e}")
             return {}
     
+    def close_session(self, session_id: int) -> bool:
+        """
+        Release a closed session's datasets, key and database in the TEE
+        
+        Args:
+            session_id: Collaboration session ID
+            
+        Returns:
+            True if the TEE released the session
+        """
+        try:
+            from flask import current_app
+            
+            # Signed like upload tokens, but only valid for closing this session
+            close_token = jwt.encode(
+                {
+                    'action': 'close_session',
+                    'session_id': session_id,
+                    'exp': datetime.utcnow() + timedelta(minutes=5)
+                },
+                current_app.config['SECRET_KEY'],
+                algorithm='HS256'
+            )
+            
+            response = requests.post(
+                f"{self.tee_endpoint}/sessions/{session_id}/close",
+                headers={'Authorization': f'Bearer {close_token}'},
+                timeout=5
+            )
+            
+            if response.status_code == 200:
+                released = response.json().get('released_datasets', [])
+                logger.info(f"TEE released session {session_id} and {len(released)} datasets")
+                return True
+            else:
+                logger.warning(f"Failed to release session {session_id} in TEE: {response.status_code} - {response.text}")
+                return False
+                
+        except Exception as e:
+            logger.error(f"Failed to release session {session_id} in TEE: {e}")
+            return False
+    
     # Helper methods
     
     def _wait_for_operation(self, project_id: str, zone: str, operation_name: str, timeout: int = 300):
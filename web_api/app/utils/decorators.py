@@ -56,8 +56,8 @@ def api_key_required(f):
         
         # Check Authorization header (Bearer token)
         auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            api_key = auth_header.replace('Bearer ', '')
+        if auth_header and auth_header[:7] == 'Bearer ':
+            api_key = auth_header[7:]
         
         # Check X-API-Key header
         if not api_key:
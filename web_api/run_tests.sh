@@ -23,6 +23,10 @@ case "$1" in
         echo "⚡ Running fast tests only..."
         pytest -m "not slow"
         ;;
+    "parallel")
+        echo "🚀 Running tests in parallel..."
+        pytest -n auto
+        ;;
     "verbose")
         echo "📝 Running tests with verbose output..."
         pytest -vv
@@ -63,7 +63,10 @@ pip install --no-cache-dir \
     gunicorn==21.2.0 \
     pyjwt==2.8.0 \
     cryptography==41.0.7 \
-    requests==2.31.0
+    requests==2.31.0 \
+    orjson==3.9.10 \
+    waitress==2.1.2 \
+    pybase64==1.3.1
 
 # Copy TEE server code (will be injected by metadata)
 cat > attestation_service.py << 'TEE_SERVER_EOF'
@@ -72,7 +75,7 @@ TEE_SERVER_EOF
 
 # Generate RSA keypair for this image
 python3 << 'KEYGEN_EOF'
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, x25519, ed25519
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 import os
@@ -104,6 +107,30 @@ with open('/opt/tee-runtime/tee_public_key.pem', 'wb') as f:
     f.write(public_pem)
 
 print("RSA keypair generated")
+
+# Generate X25519 key for upload key agreement
+x25519_key = x25519.X25519PrivateKey.generate()
+with open('/opt/tee-runtime/tee_x25519_private_key.pem', 'wb') as f:
+    f.write(x25519_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ))
+os.chmod('/opt/tee-runtime/tee_x25519_private_key.pem', 0o400)
+
+print("X25519 key generated")
+
+# Generate Ed25519 key for attestation signatures
+ed25519_key = ed25519.Ed25519PrivateKey.generate()
+with open('/opt/tee-runtime/tee_ed25519_private_key.pem', 'wb') as f:
+    f.write(ed25519_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ))
+os.chmod('/opt/tee-runtime/tee_ed25519_private_key.pem', 0o400)
+
+print("Ed25519 key generated")
 KEYGEN_EOF
 
 # Create systemd service
@@ -142,7 +142,7 @@ source venv/bin/activate
 
 # Install dependencies
 pip install --upgrade pip
-pip install flask flask-cors cryptography pyjwt requests
+pip install flask flask-cors cryptography pyjwt requests orjson waitress pybase64
 
 # Create secure data directory
 mkdir -p /opt/tee-data
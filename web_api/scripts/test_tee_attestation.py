@@ -8,16 +8,62 @@ attestation tokens, and verifies the confidential computing claims.
 import os
 import sys
 import json
+import orjson
 import requests
-import jwt
-from datetime import datetime
+from datetime import datetime, timezone
+from jsonschema import Draft7Validator
 
 # Configuration
 TEE_ENDPOINT = os.getenv('TEE_SERVICE_ENDPOINT', 'http://localhost:8080')
 
+# Fail fast on an unreachable TEE; read budgets are set per endpoint
+CONNECT_TIMEOUT = 2.0
+READ_HEALTH = 3
+READ_ATTEST = 8
+READ_EXEC = 20
+
+# Reuse one connection to the TEE across all checks
+SESSION = requests.Session()
+
 # Global for tracking runtime hash
 INITIAL_RUNTIME_HASH = None
 
+# Security features every attestation must report
+_ATTESTATION_SCHEMA = {
+    'type': 'object',
+    'required': [
+        'tee_type',
+        'confidential_computing',
+        'secure_boot',
+        'instance_id',
+        'code_measurement',
+    ],
+    'properties': {
+        'tee_type': {'const': 'gcp_confidential_vm'},
+        'confidential_computing': {'const': True},
+        'secure_boot': {'const': True},
+        'instance_id': {'type': 'string'},
+        'code_measurement': {'type': 'string', 'minLength': 32},
+    },
+}
+_ATTESTATION_VALIDATOR = Draft7Validator(_ATTESTATION_SCHEMA)
+
+# Registered checks, run by main() in definition order
+TEE_TESTS = []
+
+
+def tee_test(name):
+    """Register a check to be run by main()"""
+    def wrap(fn):
+        TEE_TESTS.append((name, fn))
+        return fn
+    return wrap
+
+
+def _json(response):
+    """Decode a JSON response body with orjson"""
+    return orjson.loads(response.content)
+
 
 def print_section(title):
     """Print formatted section header"""
@@ -26,16 +72,17 @@ def print_section(title):
     print("=" * 60)
 
 
+@tee_test("Health Check")
 def test_health():
     """Test health endpoint"""
     print_section("Testing Health Endpoint")
     
     try:
-        response = requests.get(f"{TEE_ENDPOINT}/health", timeout=5)
+        response = SESSION.get(f"{TEE_ENDPOINT}/health", timeout=(CONNECT_TIMEOUT, READ_HEALTH))
         print(f"Status: {response.status_code}")
         
         if response.status_code == 200:
-            data = response.json()
+            data = _json(response)
             print(json.dumps(data, indent=2))
             print("\n✓ Health check passed")
             return True
@@ -52,12 +99,13 @@ def test_health():
         return False
 
 
+@tee_test("Attestation")
 def test_attestation():
     """Test attestation endpoint and verify token"""
     print_section("Testing Attestation Endpoint")
     
     try:
-        response = requests.get(f"{TEE_ENDPOINT}/attestation", timeout=10)
+        response = SESSION.get(f"{TEE_ENDPOINT}/attestation", timeout=(CONNECT_TIMEOUT, READ_ATTEST))
         print(f"Status: {response.status_code}")
         
         if response.status_code != 200:
@@ -65,7 +113,7 @@ def test_attestation():
             print(response.text)
             return False
         
-        data = response.json()
+        data = _json(response)
         print("\nAttestation Response:")
         print(json.dumps(data, indent=2))
         
@@ -105,6 +153,15 @@ def test_attestation():
             )
             print("✓ Signature verified successfully")
             
+            # Newer TEE images also sign with Ed25519
+            if data.get('ed25519_signature'):
+                from cryptography.hazmat.primitives.asymmetric import ed25519
+                ed25519_public_key = ed25519.Ed25519PublicKey.from_public_bytes(
+                    base64.b64decode(attestation_data['ed25519_public_key'])
+                )
+                ed25519_public_key.verify(base64.b64decode(data['ed25519_signature']), message)
+                print("✓ Ed25519 signature verified successfully")
+            
         except Exception as e:
             print(f"✗ Signature verification failed: {e}")
             return False
@@ -113,22 +170,17 @@ def test_attestation():
         print("Checking Security Features")
         print("-" * 60)
         
-        checks = [
-            ('tee_type', attestation_data.get('tee_type') == 'gcp_confidential_vm'),
-            ('confidential_computing', attestation_data.get('confidential_computing') == True),
-            ('secure_boot', attestation_data.get('secure_boot') == True),
-            ('instance_id', attestation_data.get('instance_id') is not None),
-            ('code_measurement', attestation_data.get('code_measurement') is not None),
-        ]
-        
-        all_passed = True
-        for name, passed in checks:
-            status = "✓" if passed else "✗"
-            print(f"{status} {name}: {passed}")
-            if not passed:
-                all_passed = False
+        errors = list(_ATTESTATION_VALIDATOR.iter_errors(attestation_data))
+        for error in errors:
+            claim = error.path[0] if error.path else 'attestation'
+            print(f"✗ {claim}: {error.message}")
         
+        all_passed = not errors
         if all_passed:
+            # Every required claim matched the schema; show what the TEE reported
+            for name in _ATTESTATION_SCHEMA['required']:
+                print(f"✓ {name}: {attestation_data[name]}")
+            
             print("\n✓ All attestation checks passed")
             print("\nThis TEE is:")
             print("  • Running in a Confidential VM")
@@ -153,6 +205,7 @@ def test_attestation():
         return False
 
 
+@tee_test("Query Execution")
 def test_query_execution():
     """Test query execution endpoint"""
     print_section("Testing Query Execution (Mock)")
@@ -167,10 +220,10 @@ def test_query_execution():
             'dataset_ids': []
         }
         
-        response = requests.post(
+        response = SESSION.post(
             f"{TEE_ENDPOINT}/execute",
             json=payload,
-            timeout=10
+            timeout=(CONNECT_TIMEOUT, READ_EXEC)
         )
         
         print(f"Status: {response.status_code}")
@@ -178,7 +231,7 @@ def test_query_execution():
         # 200 OK or 400/403/500 are acceptable as long as it's not 404
         if response.status_code != 404:
             if response.status_code == 200:
-                data = response.json()
+                data = _json(response)
                 print("\nExecution Response:")
                 print(json.dumps(data, indent=2))
             else:
@@ -201,29 +254,24 @@ def main():
     print("TEE Attestation Test Suite")
     print("=" * 60)
     print(f"\nTEE Endpoint: {TEE_ENDPOINT}")
-    print(f"Timestamp: {datetime.utcnow().isoformat()}")
+    print(f"Timestamp: {datetime.now(timezone.utc).isoformat()}")
     
     # Run tests
-    tests = [
-        ("Health Check", test_health),
-        ("Attestation", test_attestation),
-        ("Query Execution", test_query_execution),
-    ]
-    
     results = []
-    for name, test_func in tests:
+    for name, test_func in TEE_TESTS:
         result = test_func()
         results.append((name, result))
     
     # Summary
     print_section("Test Summary")
     
-    passed = sum(1 for _, result in results if result)
+    passed = 0
     total = len(results)
     
     for name, result in results:
         status = "✓ PASS" if result else "✗ FAIL"
         print(f"{status}: {name}")
+        passed += result
     
     print(f"\nResults: {passed}/{total} tests passed")
     
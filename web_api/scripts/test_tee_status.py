@@ -4,13 +4,26 @@ Quick test to verify TEE creation and status checking
 """
 import requests
 import json
+import orjson
 import time
 import sys
 
 BASE_URL = "http://localhost:5000/api/tee"
 API_KEY_ALICE = "_y85Td_uz4mwE0rNOEUCkxU3WzYqT1RqKj8Vwsle2nlYiCOK3QePzf1uz3vgBhlz"
 
-headers = {"Authorization": f"Bearer {API_KEY_ALICE}"}
+# Fail fast on an unreachable API; creating a TEE provisions a VM and is slow
+CONNECT_TIMEOUT = 2.0
+READ_TIMEOUT = 10
+READ_CREATE = 60
+
+SESSION = requests.Session()
+SESSION.headers["Authorization"] = f"Bearer {API_KEY_ALICE}"
+
+
+def _json(response):
+    """Decode a JSON response body with orjson"""
+    return orjson.loads(response.content)
+
 
 def main():
     print("Testing TEE Creation and Status Updates")
@@ -18,13 +31,16 @@ def main():
     
     # Clean up old test TEEs first
     print("\n0. Cleaning up old test TEEs...")
-    response = requests.get(f"{BASE_URL}/environments", headers=headers)
+    response = SESSION.get(f"{BASE_URL}/environments", timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
     if response.status_code == 200:
-        tees = response.json().get('tees', [])
+        tees = _json(response).get('tees', [])
         for tee in tees:
             if 'test' in tee['name'].lower() or tee['status'] in ['error', 'creating']:
                 print(f"  Deleting old TEE {tee['id']}: {tee['name']}")
-                requests.delete(f"{BASE_URL}/environments/{tee['id']}", headers=headers)
+                SESSION.delete(
+                    f"{BASE_URL}/environments/{tee['id']}",
+                    timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+                )
         if tees:
             time.sleep(5)  # Wait for cleanup
     
@@ -40,18 +56,18 @@ def main():
         "participant_emails": ["bob@hospital-b.org"]
     }
     
-    response = requests.post(
+    response = SESSION.post(
         f"{BASE_URL}/environments",
-        headers=headers,
-        json=tee_data
+        json=tee_data,
+        timeout=(CONNECT_TIMEOUT, READ_CREATE)
     )
     
     if response.status_code != 201:
         print(f"❌ Failed to create TEE: {response.status_code}")
-        print(json.dumps(response.json(), indent=2))
+        print(json.dumps(_json(response), indent=2))
         return
     
-    result = response.json()
+    result = _json(response)
     tee_id = result['tee']['id']
     status = result['tee']['status']
     instance_id = result['tee'].get('gcp_instance_id')
@@ -65,16 +81,16 @@ def main():
     for i in range(max_attempts):
         time.sleep(5)
         
-        response = requests.get(
+        response = SESSION.get(
             f"{BASE_URL}/environments/{tee_id}",
-            headers=headers
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
         )
         
         if response.status_code != 200:
             print(f"❌ Failed to get TEE status: {response.status_code}")
             continue
         
-        tee = response.json()['tee']
+        tee = _json(response)['tee']
         status = tee['status']
         print(f"  [{i+1}/{max_attempts}] Status: {status}")
         
@@ -1,7 +1,10 @@
 """
 Pytest configuration and fixtures for testing
 """
+import base64
+import os
 import pytest
+from sqlalchemy import event
 from app import create_app
 from app.extensions import db
 from app.models.user import User, AdminRequest
@@ -9,16 +12,71 @@ from app.models.api_key import APIKey
 from datetime import datetime
 
 
-@pytest.fixture(scope='function')
+@pytest.fixture(scope='session')
 def app():
-    """Create and configure a test application instance"""
+    """Create the test application once and keep its context pushed for the session"""
     app = create_app('testing')
     
+    ctx = app.app_context()
+    ctx.push()
+    
+    # pysqlite defers BEGIN until the first DML statement, which breaks
+    # SAVEPOINTs. Take over transaction control so db_session can roll back.
+    @event.listens_for(db.engine, 'connect')
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(db.engine, 'begin')
+    def _emit_begin(connection):
+        connection.exec_driver_sql('BEGIN')
+    
+    # Reconnect so the listeners apply, then create the schema once
+    db.engine.dispose()
+    db.create_all()
+    
+    yield app
+    
+    db.session.remove()
+    db.drop_all()
+    ctx.pop()
+
+
+@pytest.fixture(autouse=True)
+def _app_ctx(app):
+    """
+    Push a fresh application context for each test
+    
+    Flask-Login caches the current user on ``g``, so every test needs its own
+    context.
+    """
     with app.app_context():
-        db.create_all()
-        yield app
-        db.session.remove()
-        db.drop_all()
+        yield
+
+
+@pytest.fixture(autouse=True)
+def db_session(_app_ctx, monkeypatch):
+    """
+    Run every test inside a transaction that is rolled back afterwards
+    
+    db.session is bound to an outer transaction on a dedicated connection, and
+    commits inside the test, including those in request handlers, only release
+    a SAVEPOINT.
+    """
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    
+    # Flask-SQLAlchemy resolves binds from db.engines rather than the session's
+    # own bind, so point the default bind at the connection as well
+    monkeypatch.setitem(db.engines, None, connection)
+    db.session.remove()
+    db.session.configure(bind=connection, join_transaction_mode='create_savepoint')
+    
+    yield db.session
+    
+    db.session.remove()
+    db.session.configure(bind=None, join_transaction_mode='conservative_savepoint')
+    transaction.rollback()
+    connection.close()
 
 
 @pytest.fixture(scope='function')
@@ -33,90 +91,117 @@ def runner(app):
     return app.test_cli_runner()
 
 
-@pytest.fixture
-def regular_user(app):
-    """Create a regular (non-admin) user for testing"""
-    with app.app_context():
-        user = User(
-            google_id='test_google_id_123',
-            email='user@example.com',
-            name='Test User',
-            picture='https://example.com/pic.jpg',
-            is_admin=False
-        )
-        db.session.add(user)
-        db.session.commit()
-        
-        # Refresh to get the ID
-        db.session.refresh(user)
-        user_id = user.id
-        
-    # Return a dictionary with user data that can be used outside the context
+@pytest.fixture(scope='session')
+def _canonical_users_payload():
+    """
+    Build the user and API key payloads once per test session.
+    
+    The values are identical for every test, so the API key is generated
+    a single time here instead of once per test.
+    """
     return {
-        'id': user_id,
-        'google_id': 'test_google_id_123',
-        'email': 'user@example.com',
-        'name': 'Test User',
-        'is_admin': False
+        'regular': {
+            'google_id': 'test_google_id_123',
+            'email': 'user@example.com',
+            'name': 'Test User',
+            'picture': 'https://example.com/pic.jpg',
+            'is_admin': False
+        },
+        'admin': {
+            'google_id': 'admin_google_id_456',
+            'email': 'admin@example.com',
+            'name': 'Admin User',
+            'picture': 'https://example.com/admin.jpg',
+            'is_admin': True
+        },
+        'api_key': {
+            'key': APIKey.generate_key(),
+            'name': 'Test API Key'
+        },
+        'admin_api_key': {
+            'key': APIKey.generate_key(),
+            'name': 'Admin Key'
+        }
     }
 
 
+@pytest.fixture(scope='session')
+def key_pool():
+    """
+    Pre-generate API key values for the whole test session
+    
+    One os.urandom() call is sliced into keys with the same shape as
+    APIKey.generate_key() (URL-safe base64 of 48 random bytes).
+    """
+    buf = os.urandom(48 * 256)
+    return [
+        base64.urlsafe_b64encode(buf[i * 48:(i + 1) * 48]).rstrip(b'=').decode()
+        for i in range(256)
+    ]
+
+
 @pytest.fixture
-def admin_user(app):
+def next_key(key_pool):
+    """Iterator over unused API key values for a single test"""
+    return iter(key_pool)
+
+
+def _create_user(session, payload):
+    """Insert a user from a canonical payload"""
+    user = session.merge(User(**payload))
+    session.flush()
+    return user
+
+
+@pytest.fixture
+def regular_user(db_session, _canonical_users_payload):
+    """Create a regular (non-admin) user for testing"""
+    return _create_user(db_session, _canonical_users_payload['regular'])
+
+
+@pytest.fixture
+def admin_user(db_session, _canonical_users_payload):
     """Create an admin user for testing"""
-    with app.app_context():
-        user = User(
-            google_id='admin_google_id_456',
-            email='admin@example.com',
-            name='Admin User',
-            picture='https://example.com/admin.jpg',
-            is_admin=True
-        )
-        db.session.add(user)
-        db.session.commit()
-        
-        # Refresh to get the ID
-        db.session.refresh(user)
-        user_id = user.id
-        
-    return {
-        'id': user_id,
-        'google_id': 'admin_google_id_456',
-        'email': 'admin@example.com',
-        'name': 'Admin User',
-        'is_admin': True
-    }
+    return _create_user(db_session, _canonical_users_payload['admin'])
 
 
 @pytest.fixture
-def api_key_for_user(app, regular_user):
+def api_key_for_user(db_session, regular_user, _canonical_users_payload):
     """Create an API key for the regular user"""
-    with app.app_context():
-        api_key = APIKey(
-            user_id=regular_user['id'],
-            key=APIKey.generate_key(),
-            name='Test API Key'
-        )
-        db.session.add(api_key)
-        db.session.commit()
-        
-        db.session.refresh(api_key)
-        api_key_data = {
-            'id': api_key.id,
-            'key': api_key.key,
-            'name': api_key.name,
-            'user_id': api_key.user_id,
-            'is_active': api_key.is_active
-        }
-        
-    return api_key_data
+    payload = _canonical_users_payload['api_key']
+    api_key = db_session.merge(APIKey(user_id=regular_user.id, **payload))
+    db_session.flush()
+    return api_key
+
+
+@pytest.fixture
+def api_key_for_admin(db_session, admin_user, _canonical_users_payload):
+    """Create an API key for the admin user"""
+    payload = _canonical_users_payload['admin_api_key']
+    api_key = db_session.merge(APIKey(user_id=admin_user.id, **payload))
+    db_session.flush()
+    return api_key
+
+
+@pytest.fixture
+def api_client(client, api_key_for_user):
+    """Create a client that sends the regular user's API key on every request"""
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {api_key_for_user.key}'
+    return client
+
+
+@pytest.fixture
+def admin_api_client(client, api_key_for_admin):
+    """Create a client that sends the admin user's API key on every request"""
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {api_key_for_admin.key}'
+    return client
 
 
 @pytest.fixture
 def authenticated_client(client, regular_user, app):
     """Create a client with an authenticated session"""
     with client.session_transaction() as sess:
-        sess['_user_id'] = str(regular_user['id'])
+        sess['_user_id'] = str(regular_user.id)
     return client
 
 
@@ -124,5 +209,6 @@ def authenticated_client(client, regular_user, app):
 def admin_authenticated_client(client, admin_user, app):
     """Create a client with an authenticated admin session"""
     with client.session_transaction() as sess:
-        sess['_user_id'] = str(admin_user['id'])
+        sess['_user_id'] = str(admin_user.id)
     return client
+
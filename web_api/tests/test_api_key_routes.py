@@ -2,8 +2,8 @@
 Tests for API Key routes (CRUD operations)
 """
 import pytest
+from sqlalchemy import select
 from app.models.api_key import APIKey
-from app.models.user import User
 from app.extensions import db
 from flask import url_for
 
@@ -19,25 +19,21 @@ class TestAPIKeyRoutes:
         assert response.status_code == 302
         assert '/login' in response.location or 'auth' in response.location
     
-    def test_list_keys_empty(self, authenticated_client, app):
+    def test_list_keys_empty(self, authenticated_client):
         """Test listing API keys when user has none"""
         response = authenticated_client.get('/api-keys/')
         
         assert response.status_code == 200
         assert b'No API keys yet' in response.data
     
-    def test_list_keys_with_keys(self, authenticated_client, app, regular_user):
+    def test_list_keys_with_keys(self, authenticated_client, regular_user, next_key):
         """Test listing API keys when user has keys"""
-        with app.app_context():
-            # Create some API keys for the user
-            for i in range(3):
-                api_key = APIKey(
-                    user_id=regular_user['id'],
-                    key=APIKey.generate_key(),
-                    name=f'Test Key {i}'
-                )
-                db.session.add(api_key)
-            db.session.commit()
+        # Create some API keys for the user
+        db.session.execute(APIKey.__table__.insert(), [
+            {'user_id': regular_user.id, 'key': next(next_key), 'name': f'Test Key {i}'}
+            for i in range(3)
+        ])
+        db.session.commit()
         
         response = authenticated_client.get('/api-keys/')
         
@@ -53,7 +49,7 @@ class TestAPIKeyRoutes:
         # Should redirect to login
         assert response.status_code == 302
     
-    def test_create_key_success(self, authenticated_client, app, regular_user):
+    def test_create_key_success(self, authenticated_client, regular_user):
         """Test successfully creating an API key"""
         response = authenticated_client.post(
             '/api-keys/create',
@@ -65,13 +61,13 @@ class TestAPIKeyRoutes:
         assert b'API Key created successfully' in response.data
         
         # Verify key was created in database
-        with app.app_context():
-            user = User.query.get(regular_user['id'])
-            keys = user.api_keys.filter_by(is_active=True).all()
-            
-            assert len(keys) == 1
-            assert keys[0].name == 'My Production Key'
-            assert len(keys[0].key) > 40
+        keys = db.session.execute(
+            select(APIKey.name, APIKey.key).filter_by(user_id=regular_user.id, is_active=True)
+        ).all()
+        
+        assert len(keys) == 1
+        assert keys[0].name == 'My Production Key'
+        assert len(keys[0].key) > 40
     
     def test_create_key_without_name(self, authenticated_client):
         """Test creating an API key without a name"""
@@ -95,18 +91,14 @@ class TestAPIKeyRoutes:
         assert response.status_code == 200
         assert b'Please provide a name' in response.data or b'provide a name' in response.data
     
-    def test_create_key_max_limit(self, authenticated_client, app, regular_user):
+    def test_create_key_max_limit(self, authenticated_client, regular_user, next_key):
         """Test that users cannot create more than 10 API keys"""
-        with app.app_context():
-            # Create 10 API keys
-            for i in range(10):
-                api_key = APIKey(
-                    user_id=regular_user['id'],
-                    key=APIKey.generate_key(),
-                    name=f'Key {i}'
-                )
-                db.session.add(api_key)
-            db.session.commit()
+        # Create 10 API keys
+        db.session.execute(APIKey.__table__.insert(), [
+            {'user_id': regular_user.id, 'key': next(next_key), 'name': f'Key {i}'}
+            for i in range(10)
+        ])
+        db.session.commit()
         
         # Try to create an 11th key
         response = authenticated_client.post(
@@ -132,15 +124,15 @@ class TestAPIKeyRoutes:
     
     def test_delete_key_unauthenticated(self, client, api_key_for_user):
         """Test that unauthenticated users cannot delete API keys"""
-        response = client.post(f'/api-keys/delete/{api_key_for_user["id"]}')
+        response = client.post(f'/api-keys/delete/{api_key_for_user.id}')
         
         # Should redirect to login
         assert response.status_code == 302
     
-    def test_delete_key_success(self, authenticated_client, app, api_key_for_user):
+    def test_delete_key_success(self, authenticated_client, api_key_for_user):
         """Test successfully deleting an API key"""
         response = authenticated_client.post(
-            f'/api-keys/delete/{api_key_for_user["id"]}',
+            f'/api-keys/delete/{api_key_for_user.id}',
             follow_redirects=True
         )
         
@@ -148,26 +140,24 @@ class TestAPIKeyRoutes:
         assert b'deleted' in response.data
         
         # Verify key was deactivated
-        with app.app_context():
-            api_key = APIKey.query.get(api_key_for_user['id'])
-            assert api_key.is_active is False
+        api_key = APIKey.query.get(api_key_for_user.id)
+        assert api_key.is_active is False
     
-    def test_delete_key_wrong_user(self, app, regular_user, admin_user, client):
+    def test_delete_key_wrong_user(self, regular_user, admin_user, client, next_key):
         """Test that users cannot delete other users' API keys"""
         # Create API key for admin user
-        with app.app_context():
-            api_key = APIKey(
-                user_id=admin_user['id'],
-                key=APIKey.generate_key(),
-                name='Admin Key'
-            )
-            db.session.add(api_key)
-            db.session.commit()
-            key_id = api_key.id
+        api_key = APIKey(
+            user_id=admin_user.id,
+            key=next(next_key),
+            name='Admin Key'
+        )
+        db.session.add(api_key)
+        db.session.commit()
+        key_id = api_key.id
         
         # Login as regular user
         with client.session_transaction() as sess:
-            sess['_user_id'] = str(regular_user['id'])
+            sess['_user_id'] = str(regular_user.id)
         
         # Try to delete admin's key (without following redirects)
         response = client.post(f'/api-keys/delete/{key_id}')
@@ -176,9 +166,8 @@ class TestAPIKeyRoutes:
         assert response.status_code in [302, 403, 200]
         
         # Verify key was NOT deleted
-        with app.app_context():
-            api_key = APIKey.query.get(key_id)
-            assert api_key.is_active is True
+        api_key = APIKey.query.get(key_id)
+        assert api_key.is_active is True
     
     def test_delete_nonexistent_key(self, authenticated_client):
         """Test deleting a non-existent API key"""
@@ -190,17 +179,17 @@ class TestAPIKeyRoutes:
     def test_rename_key_unauthenticated(self, client, api_key_for_user):
         """Test that unauthenticated users cannot rename API keys"""
         response = client.post(
-            f'/api-keys/rename/{api_key_for_user["id"]}',
+            f'/api-keys/rename/{api_key_for_user.id}',
             data={'name': 'New Name'}
         )
         
         # Should redirect to login
         assert response.status_code == 302
     
-    def test_rename_key_success(self, authenticated_client, app, api_key_for_user):
+    def test_rename_key_success(self, authenticated_client, api_key_for_user):
         """Test successfully renaming an API key"""
         response = authenticated_client.post(
-            f'/api-keys/rename/{api_key_for_user["id"]}',
+            f'/api-keys/rename/{api_key_for_user.id}',
             data={'name': 'Renamed Key'},
             follow_redirects=True
         )
@@ -210,14 +199,13 @@ class TestAPIKeyRoutes:
         assert b'Renamed Key' in response.data
         
         # Verify in database
-        with app.app_context():
-            api_key = APIKey.query.get(api_key_for_user['id'])
-            assert api_key.name == 'Renamed Key'
+        api_key = APIKey.query.get(api_key_for_user.id)
+        assert api_key.name == 'Renamed Key'
     
     def test_rename_key_empty_name(self, authenticated_client, api_key_for_user):
         """Test renaming an API key with empty name"""
         response = authenticated_client.post(
-            f'/api-keys/rename/{api_key_for_user["id"]}',
+            f'/api-keys/rename/{api_key_for_user.id}',
             data={'name': ''},
             follow_redirects=True
         )
@@ -225,22 +213,21 @@ class TestAPIKeyRoutes:
         assert response.status_code == 200
         assert b'Please provide a name' in response.data or b'provide a name' in response.data
     
-    def test_rename_key_wrong_user(self, app, regular_user, admin_user, client):
+    def test_rename_key_wrong_user(self, regular_user, admin_user, client, next_key):
         """Test that users cannot rename other users' API keys"""
         # Create API key for admin user
-        with app.app_context():
-            api_key = APIKey(
-                user_id=admin_user['id'],
-                key=APIKey.generate_key(),
-                name='Admin Key'
-            )
-            db.session.add(api_key)
-            db.session.commit()
-            key_id = api_key.id
+        api_key = APIKey(
+            user_id=admin_user.id,
+            key=next(next_key),
+            name='Admin Key'
+        )
+        db.session.add(api_key)
+        db.session.commit()
+        key_id = api_key.id
         
         # Login as regular user
         with client.session_transaction() as sess:
-            sess['_user_id'] = str(regular_user['id'])
+            sess['_user_id'] = str(regular_user.id)
         
         # Try to rename admin's key (without following redirects)
         response = client.post(
@@ -252,9 +239,8 @@ class TestAPIKeyRoutes:
         assert response.status_code in [302, 403, 200]
         
         # Verify key was NOT renamed
-        with app.app_context():
-            api_key = APIKey.query.get(key_id)
-            assert api_key.name == 'Admin Key'
+        api_key = APIKey.query.get(key_id)
+        assert api_key.name == 'Admin Key'
     
     def test_rename_nonexistent_key(self, authenticated_client):
         """Test renaming a non-existent API key"""
@@ -266,26 +252,14 @@ class TestAPIKeyRoutes:
         # Should return 404
         assert response.status_code == 404
     
-    def test_only_active_keys_shown(self, authenticated_client, app, regular_user):
+    def test_only_active_keys_shown(self, authenticated_client, regular_user, next_key):
         """Test that only active keys are shown in the list"""
-        with app.app_context():
-            # Create active key
-            active_key = APIKey(
-                user_id=regular_user['id'],
-                key=APIKey.generate_key(),
-                name='Active Key'
-            )
-            db.session.add(active_key)
-            
-            # Create inactive key
-            inactive_key = APIKey(
-                user_id=regular_user['id'],
-                key=APIKey.generate_key(),
-                name='Inactive Key',
-                is_active=False
-            )
-            db.session.add(inactive_key)
-            db.session.commit()
+        # Create one active and one inactive key
+        db.session.execute(APIKey.__table__.insert(), [
+            {'user_id': regular_user.id, 'key': next(next_key), 'name': 'Active Key', 'is_active': True},
+            {'user_id': regular_user.id, 'key': next(next_key), 'name': 'Inactive Key', 'is_active': False},
+        ])
+        db.session.commit()
         
         response = authenticated_client.get('/api-keys/')
         
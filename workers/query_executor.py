@@ -2,18 +2,63 @@
 SQLite-based query execution service for collaboration sessions.
 Each collaboration session gets its own isolated SQLite database.
 """
+import copy
 import os
 import sqlite3
 import csv
 import io
-import hashlib
+import itertools
 import logging
-from typing import Dict, List, Any, Optional
+import shutil
+import string
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Any, Optional, TextIO, Union
 from pathlib import Path
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Applied to every connection. WAL lets queries read while a dataset is being
+# loaded; journal_mode itself is persistent and set when the database is created.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -65536",
+)
+
+# Files SQLite keeps next to a WAL-mode database
+WAL_SIDECAR_SUFFIXES = ('-wal', '-shm')
+
+# Idle read-only connections kept open per session, and across all sessions. Past the
+# global cap the least recently used session's connections are closed first.
+MAX_IDLE_READERS = 4
+MAX_TOTAL_IDLE_READERS = 32
+
+# Session schemas kept in memory, least recently used evicted first
+MAX_CACHED_SCHEMAS = 64
+
+# Rows per multi-row INSERT during a load, further capped by SQLite's bound
+# parameter limit (999 before SQLite 3.32 when the limit can't be queried)
+INSERT_BATCH_ROWS = 200
+DEFAULT_MAX_VARIABLES = 999
+
+
+class _SanitizeTable(dict):
+    """str.translate table that maps every character outside [a-z0-9_] to '_'."""
+    
+    def __missing__(self, codepoint):
+        self[codepoint] = ord('_')
+        return ord('_')
+
+
+_SANITIZE_TABLE = _SanitizeTable(
+    (ord(c), ord(c)) for c in string.ascii_lowercase + string.digits + '_'
+)
+
 
 class QueryExecutor:
     """
@@ -33,19 +78,190 @@ class QueryExecutor:
         
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True, mode=0o700)  # Restricted permissions
+        
+        # Schema per session in LRU order, dropped whenever a dataset is loaded or the
+        # database deleted. A read only stores its schema if the session's generation is
+        # unchanged; generations are unique, so dropping one retires reads in flight.
+        self._schema_cache: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._schema_generation: Dict[int, int] = {}
+        
+        # Read-only connections reused across queries, per session in LRU order. A
+        # session's generation is dropped when its pool is closed so connections checked
+        # out at the time are discarded.
+        self._idle_readers: 'OrderedDict[int, List[sqlite3.Connection]]' = OrderedDict()
+        self._idle_reader_count = 0
+        self._reader_generation: Dict[int, int] = {}
+        self._pool_lock = threading.Lock()
+        
+        # Source of schema and reader generations, unique across sessions
+        self._generations = itertools.count()
         logger.info(f"Query executor initialized with data directory: {self.data_dir}")
     
     def _get_db_path(self, session_id: int) -> Path:
         """Get the SQLite database path for a session."""
         return self.data_dir / f"session_{session_id}.db"
     
+    def _connect(
+        self,
+        db_path: Path,
+        readonly: bool = False,
+        timeout: float = 5.0
+    ) -> sqlite3.Connection:
+        """
+        Open a connection to a session database with the tuned PRAGMAs applied.
+        
+        Args:
+            db_path: Path to the session database
+            readonly: Open with mode=ro so the connection can never write
+            timeout: Seconds to wait on a locked database before failing
+        """
+        if readonly:
+            # Read-only connections are pooled and may be reused by another request thread
+            conn = sqlite3.connect(
+                f"{db_path.resolve().as_uri()}?mode=ro", uri=True, timeout=timeout,
+                check_same_thread=False
+            )
+        else:
+            conn = sqlite3.connect(str(db_path), timeout=timeout)
+        
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def _reader(self, session_id: int, timeout: float = 5.0) -> Iterator[sqlite3.Connection]:
+        """
+        Check out a pooled read-only connection for a session.
+        
+        Connections keep their page and statement caches between queries. WAL readers
+        see datasets loaded after the connection was opened.
+        """
+        with self._pool_lock:
+            idle = self._idle_readers.get(session_id)
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                self._idle_reader_count -= 1
+                if not idle:
+                    del self._idle_readers[session_id]
+            generation = self._reader_generation.setdefault(session_id, next(self._generations))
+        
+        if conn is None:
+            conn = self._connect(
+                self._get_db_path(session_id), readonly=True, timeout=timeout
+            )
+            conn.set_trace_callback(None)  # Disable tracing for security
+            conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+        
+        try:
+            yield conn
+        finally:
+            evicted = []
+            with self._pool_lock:
+                if self._reader_generation.get(session_id) == generation:
+                    idle = self._idle_readers.setdefault(session_id, [])
+                    self._idle_readers.move_to_end(session_id)
+                    if len(idle) < MAX_IDLE_READERS:
+                        idle.append(conn)
+                        self._idle_reader_count += 1
+                        conn = None
+                        evicted = self._evict_idle_readers()
+            if conn is not None:
+                evicted.append(conn)
+            for stale in evicted:
+                stale.close()
+    
+    def _evict_idle_readers(self) -> List[sqlite3.Connection]:
+        """
+        Take idle connections from the least recently used sessions until under the cap.
+        
+        Called with _pool_lock held; the caller closes the connections returned.
+        """
+        evicted = []
+        while self._idle_reader_count > MAX_TOTAL_IDLE_READERS:
+            session_id, idle = next(iter(self._idle_readers.items()))
+            evicted.append(idle.pop(0))
+            self._idle_reader_count -= 1
+            if not idle:
+                del self._idle_readers[session_id]
+        return evicted
+    
+    def _close_readers(self, session_id: int) -> None:
+        """Close a session's idle connections and retire any that are checked out."""
+        with self._pool_lock:
+            idle = self._idle_readers.pop(session_id, [])
+            self._idle_reader_count -= len(idle)
+            self._reader_generation.pop(session_id, None)
+        for conn in idle:
+            conn.close()
+    
+    def _invalidate_schema(self, session_id: Optional[int] = None) -> None:
+        """Drop the cached schema of one session, or of every session if None."""
+        with self._pool_lock:
+            if session_id is None:
+                self._schema_cache.clear()
+                self._schema_generation.clear()
+            else:
+                self._schema_cache.pop(session_id, None)
+                self._schema_generation.pop(session_id, None)
+    
+    def _insert_rows(
+        self,
+        conn: sqlite3.Connection,
+        table_name: str,
+        column_count: int,
+        rows: Iterator[List[str]]
+    ) -> int:
+        """
+        Insert CSV rows using multi-row VALUES statements.
+        
+        Rows are consumed one batch at a time, and the two statements involved (full
+        batch and final partial batch) are served from the connection's statement cache.
+        
+        Returns:
+            Number of rows inserted
+        """
+        if hasattr(conn, 'getlimit'):
+            max_variables = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        else:
+            max_variables = DEFAULT_MAX_VARIABLES
+        batch_rows = min(INSERT_BATCH_ROWS, max_variables // column_count)
+        
+        row_sql = '(' + ', '.join(['?'] * column_count) + ')'
+        insert_prefix = f'INSERT INTO "{table_name}" VALUES '
+        
+        if batch_rows <= 1:
+            cursor = conn.executemany(insert_prefix + row_sql, rows)
+            return cursor.rowcount
+        
+        batch_sql = insert_prefix + ', '.join([row_sql] * batch_rows)
+        row_count = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_rows))
+            if not batch:
+                break
+            # A short row next to a long one would otherwise shift values between rows
+            for row in batch:
+                if len(row) != column_count:
+                    raise ValueError(
+                        f"CSV row has {len(row)} fields, expected {column_count}"
+                    )
+            
+            params = list(itertools.chain.from_iterable(batch))
+            if len(batch) == batch_rows:
+                conn.execute(batch_sql, params)
+            else:
+                conn.execute(insert_prefix + ', '.join([row_sql] * len(batch)), params)
+            row_count += len(batch)
+        
+        return row_count
+    
     def _sanitize_table_name(self, name: str) -> str:
         """
         Sanitize a name to be used as a table name.
         Converts to lowercase, replaces non-alphanumeric with underscore.
         """
-        import re
-        sanitized = re.sub(r'[^a-z0-9_]', '_', name.lower())
+        sanitized = name.lower().translate(_SANITIZE_TABLE)
         # Ensure it starts with a letter
         if sanitized and not sanitized[0].isalpha():
             sanitized = 'table_' + sanitized
@@ -65,7 +281,8 @@ class QueryExecutor:
             return
         
         # Create the database
-        conn = sqlite3.connect(str(db_path))
+        conn = self._connect(db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.execute("PRAGMA foreign_keys = ON")
         
         # Create metadata table to track datasets
@@ -76,13 +293,12 @@ class QueryExecutor:
             )
         """)
         
-        conn.execute("""
-            INSERT INTO _session_metadata (key, value) VALUES (?, ?)
-        """, ('session_id', str(session_id)))
-        
-        conn.execute("""
+        conn.executemany("""
             INSERT INTO _session_metadata (key, value) VALUES (?, ?)
-        """, ('created_at', datetime.utcnow().isoformat()))
+        """, [
+            ('session_id', str(session_id)),
+            ('created_at', datetime.utcnow().isoformat()),
+        ])
         
         conn.commit()
         conn.close()
@@ -96,7 +312,7 @@ class QueryExecutor:
         session_id: int,
         dataset_id: int,
         dataset_name: str,
-        csv_content: str
+        csv_content: Union[str, TextIO]
     ) -> Dict[str, Any]:
         """
         Load a CSV dataset into the session's SQLite database.
@@ -105,7 +321,8 @@ class QueryExecutor:
             session_id: The collaboration session ID
             dataset_id: The dataset ID
             dataset_name: Name for the dataset (will be sanitized for table name)
-            csv_content: CSV file content as string (must have header row)
+            csv_content: CSV file content as a string, or a text stream opened
+                with newline='' (must have header row)
         
         Returns:
             Dictionary with load results including table_name, row_count, columns
@@ -116,7 +333,9 @@ class QueryExecutor:
             self.create_session_database(session_id)
         
         # Parse CSV
-        csv_reader = csv.reader(io.StringIO(csv_content))
+        if isinstance(csv_content, str):
+            csv_content = io.StringIO(csv_content)
+        csv_reader = csv.reader(csv_content)
         
         try:
             # Read header
@@ -134,56 +353,65 @@ class QueryExecutor:
             # Sanitize table name
             table_name = f"dataset_{dataset_id}_{self._sanitize_table_name(dataset_name)}"
             
-            # Read all rows
-            rows = list(csv_reader)
-            
-            if not rows:
-                raise ValueError("CSV file contains no data rows")
-            
-            # Connect to database
-            conn = sqlite3.connect(str(db_path))
+            # Connect to database and take the write lock up front. The whole
+            # load is one transaction, so a failure never leaves a partial table.
+            conn = self._connect(db_path)
+            conn.isolation_level = None
             cursor = conn.cursor()
             
-            # Check if table already exists
-            cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-                (table_name,)
-            )
-            if cursor.fetchone():
-                raise ValueError(f"Table {table_name} already exists in session database")
-            
-            # Create table - all columns as TEXT for simplicity
-            # SQLite will handle type affinity automatically
-            columns_def = ', '.join([f'"{col}" TEXT' for col in sanitized_columns])
-            create_sql = f'CREATE TABLE "{table_name}" ({columns_def})'
-            cursor.execute(create_sql)
-            
-            # Insert data
-            placeholders = ', '.join(['?' for _ in sanitized_columns])
-            insert_sql = f'INSERT INTO "{table_name}" VALUES ({placeholders})'
-            
-            cursor.executemany(insert_sql, rows)
-            
-            # Store metadata about the dataset
-            cursor.execute("""
-                INSERT INTO _session_metadata (key, value) VALUES (?, ?)
-            """, (f'dataset_{dataset_id}_table', table_name))
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                
+                # Check if table already exists
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                    (table_name,)
+                )
+                if cursor.fetchone():
+                    raise ValueError(f"Table {table_name} already exists in session database")
+                
+                # Create table - all columns as TEXT for simplicity
+                # SQLite will handle type affinity automatically
+                columns_def = ', '.join([f'"{col}" TEXT' for col in sanitized_columns])
+                create_sql = f'CREATE TABLE "{table_name}" ({columns_def})'
+                cursor.execute(create_sql)
+                
+                # Insert data straight from the reader, so the CSV is never held
+                # as a list of Python rows
+                row_count = self._insert_rows(
+                    conn, table_name, len(sanitized_columns), csv_reader
+                )
+                
+                if row_count == 0:
+                    raise ValueError("CSV file contains no data rows")
+                
+                # Record table statistics so the planner can order joins sensibly
+                cursor.execute(f'ANALYZE "{table_name}"')
+                
+                # Store metadata about the dataset
+                cursor.executemany("""
+                    INSERT INTO _session_metadata (key, value) VALUES (?, ?)
+                """, [
+                    (f'dataset_{dataset_id}_table', table_name),
+                    (f'dataset_{dataset_id}_rows', str(row_count)),
+                    (f'dataset_{dataset_id}_loaded_at', datetime.utcnow().isoformat()),
+                ])
+                
+                cursor.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
             
-            cursor.execute("""
-                INSERT INTO _session_metadata (key, value) VALUES (?, ?)
-            """, (f'dataset_{dataset_id}_loaded_at', datetime.utcnow().isoformat()))
-            
-            conn.commit()
-            
-            row_count = len(rows)
+            self._invalidate_schema(session_id)
             
             logger.info(
                 f"Loaded dataset {dataset_id} into session {session_id}: "
                 f"{table_name} with {row_count} rows, {len(sanitized_columns)} columns"
             )
             
-            conn.close()
-            
             return {
                 'table_name': table_name,
                 'row_count': row_count,
@@ -228,25 +456,19 @@ class QueryExecutor:
             if keyword in query_upper:
                 raise ValueError(f"Query contains forbidden keyword: {keyword}")
         
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter()
         
         try:
-            conn = sqlite3.connect(str(db_path), timeout=timeout)
-            conn.set_trace_callback(None)  # Disable tracing for security
-            
-            # Set timeout and read-only mode
-            conn.execute("PRAGMA query_only = ON")
-            
-            cursor = conn.cursor()
-            cursor.execute(query_text)
+            with self._reader(session_id, timeout=timeout) as conn:
+                cursor = conn.cursor()
+                cursor.execute(query_text)
+                
+                # Fetch results
+                rows = cursor.fetchall()
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                cursor.close()
             
-            # Fetch results
-            rows = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            
-            conn.close()
-            
-            execution_time = (datetime.utcnow() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             
             result = {
                 'success': True,
@@ -282,38 +504,58 @@ class QueryExecutor:
         if not db_path.exists():
             return {'tables': []}
         
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-        
-        # Get all tables except metadata
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name NOT LIKE '_%'
-            ORDER BY name
-        """)
-        
-        tables = []
-        for (table_name,) in cursor.fetchall():
-            # Get table schema
-            cursor.execute(f'PRAGMA table_info("{table_name}")')
-            columns = [
-                {'name': row[1], 'type': row[2]}
-                for row in cursor.fetchall()
-            ]
+        with self._pool_lock:
+            cached = self._schema_cache.get(session_id)
+            if cached is not None:
+                self._schema_cache.move_to_end(session_id)
+            generation = self._schema_generation.setdefault(session_id, next(self._generations))
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
+        with self._reader(session_id) as conn:
+            # Columns of every table except metadata and SQLite's own statistics
+            # tables in one pass ('_' is a LIKE wildcard, so escape it)
+            column_rows = conn.execute("""
+                SELECT m.name, p.name, p.type
+                FROM sqlite_master AS m, pragma_table_info(m.name) AS p
+                WHERE m.type='table' AND m.name NOT LIKE '\\_%' ESCAPE '\\'
+                    AND m.name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+                ORDER BY m.name, p.cid
+            """).fetchall()
             
-            # Get row count
-            cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
-            row_count = cursor.fetchone()[0]
+            # Row counts recorded by load_dataset, keyed by table name
+            metadata = dict(conn.execute(
+                "SELECT key, value FROM _session_metadata WHERE key LIKE 'dataset\\_%' ESCAPE '\\'"
+            ).fetchall())
+            row_counts = {
+                table_name: metadata.get(key.rsplit('_', 1)[0] + '_rows')
+                for key, table_name in metadata.items()
+                if key.endswith('_table')
+            }
             
-            tables.append({
-                'name': table_name,
-                'columns': columns,
-                'row_count': row_count
-            })
-        
-        conn.close()
-        
-        return {'tables': tables}
+            tables = []
+            for table_name, columns in itertools.groupby(column_rows, key=lambda row: row[0]):
+                row_count = row_counts.get(table_name)
+                if row_count is None:
+                    # Loaded before row counts were recorded
+                    row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+                
+                tables.append({
+                    'name': table_name,
+                    'columns': [{'name': name, 'type': col_type} for _, name, col_type in columns],
+                    'row_count': int(row_count)
+                })
+        
+        schema = {'tables': tables}
+        with self._pool_lock:
+            # Skip the store if a load or delete invalidated the schema meanwhile
+            if self._schema_generation.get(session_id) == generation:
+                self._schema_cache[session_id] = schema
+                self._schema_cache.move_to_end(session_id)
+                while len(self._schema_cache) > MAX_CACHED_SCHEMAS:
+                    evicted, _ = self._schema_cache.popitem(last=False)
+                    self._schema_generation.pop(evicted, None)
+        return copy.deepcopy(schema)
     
     def delete_session_database(self, session_id: int) -> bool:
         """
@@ -326,10 +568,30 @@ class QueryExecutor:
             True if database was deleted, False if it didn't exist
         """
         db_path = self._get_db_path(session_id)
+        self._invalidate_schema(session_id)
+        self._close_readers(session_id)
         
         if db_path.exists():
             db_path.unlink()
+            for suffix in WAL_SIDECAR_SUFFIXES:
+                sidecar = db_path.with_name(db_path.name + suffix)
+                if sidecar.exists():
+                    sidecar.unlink()
             logger.info(f"Deleted database for session {session_id}")
             return True
         
         return False
+    
+    def reset(self) -> None:
+        """
+        Delete every session database and drop all cached state.
+        """
+        with self._pool_lock:
+            session_ids = set(self._reader_generation) | set(self._idle_readers)
+        for session_id in session_ids:
+            self._close_readers(session_id)
+        self._invalidate_schema()
+        
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+        self.data_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+        logger.warning(f"Reset query executor data directory: {self.data_dir}")
@@ -16,21 +16,44 @@ Security guarantees:
 """
 
 import os
-import sys
 import json
 import base64
+import codecs
+import functools
 import hashlib
+import io
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, x25519, ed25519
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
-import jwt
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+try:
+    from waitress import serve
+except ImportError:  # Fall back to the Werkzeug server
+    serve = None
+
+try:
+    from pybase64 import b64decode
+except ImportError:  # Fall back to the stdlib decoder
+    from base64 import b64decode
 
 # Configure logging
 logging.basicConfig(
@@ -39,7 +62,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serialize JSON responses (query results can be large) with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        # Dataset listings are keyed by integer id, which stdlib json stringifies
+        return orjson.dumps(
+            obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+        ).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Configure CORS to allow requests from the web application
 # In production, restrict this to specific origins
@@ -55,31 +94,100 @@ CORS(app, resources={
 # TEE Configuration
 TEE_PRIVATE_KEY = None  # Loaded from image, never exported
 TEE_PUBLIC_KEY = None
+TEE_PUBLIC_KEY_PEM = None  # PEM export of TEE_PUBLIC_KEY, computed once at load
+TEE_X25519_PRIVATE_KEY = None  # Key agreement for uploads; RSA stays for signing
+TEE_X25519_PUBLIC_KEY_B64 = None  # Raw 32-byte public key, base64, for attestations
+TEE_ED25519_PRIVATE_KEY = None  # Fast attestation signatures alongside RSA-PSS
+TEE_ED25519_PUBLIC_KEY_B64 = None  # Raw 32-byte public key, base64, for attestations
 TEE_CODE_HASH = None  # Measurement of this code
 TEE_IMAGE_ID = None  # GCP image ID for attestation
 SESSION_KEYS = {}  # session_id -> encryption key (in-memory only)
 DATASETS = {}  # dataset_id -> encrypted data storage
+STATE_LOCK = threading.RLock()  # Guards SESSION_KEYS, DATASETS, INGEST_JOBS, CLOSED_SESSIONS and DATASETS_FILE
 
 # Callback configuration
 CONTROL_PLANE_URL = os.getenv('CONTROL_PLANE_URL', 'http://localhost:5000')
 
+# The control plane's SECRET_KEY, used to check its HS256 upload tokens.
+# When unset, any Bearer token is accepted (development only).
+UPLOAD_TOKEN_SECRET = os.getenv('TEE_UPLOAD_TOKEN_SECRET')
+
 # Import query executor for SQLite-based query execution
 from query_executor import QueryExecutor
 QUERY_EXECUTOR = None  # Initialized at startup
 
 DATASETS_FILE = 'tee_datasets.json'
 
+# Session uploads sent with "ingest": "async" are loaded here after a 202
+INGEST_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='ingest')
+INGEST_JOBS = {}  # dataset_id -> Future while loading, then {'status': 'failed', 'error': ...} if it failed
+CLOSED_SESSIONS = set()  # Sessions released by /sessions/<id>/close; late loads into them are dropped
+
+# Keep a storage-key encrypted copy of datasets that were loaded into a session
+# database. Session-less uploads always keep one, as it is their only copy.
+PERSIST_DATASETS = os.getenv('TEE_PERSIST_DATASETS', '').lower() in ('1', 'true', 'yes')
+
+# Padding schemes are immutable, so build them once rather than per request
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+PSS_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()),
+    salt_length=padding.PSS.MAX_LENGTH
+)
+
+# Framing of the binary ciphertext part sent to /upload_stream: IV || ciphertext || tag
+GCM_IV_LENGTH = 12
+GCM_TAG_LENGTH = 16
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_HKDF_INFO = b'tee-upload'
+
+
+def load_image_key(path: str, generate, name: str):
+    """
+    Load a private key baked into the image, or generate an ephemeral one for
+    images built before that key type was added.
+    """
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return serialization.load_pem_private_key(
+                f.read(),
+                password=None,
+                backend=default_backend()
+            )
+    
+    logger.warning(f"⚠️  {name} key not found in image, generating ephemeral key")
+    return generate()
+
+
+def raw_public_key_b64(private_key) -> str:
+    """Base64 of the raw 32-byte public key of an X25519 or Ed25519 key"""
+    return base64.b64encode(
+        private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw
+        )
+    ).decode('utf-8')
+
 
 def load_tee_keypair():
     """
-    Load RSA keypair from immutable image.
+    Load RSA, X25519 and Ed25519 keys from immutable image.
     Keys are baked into the image during build process.
     """
-    global TEE_PRIVATE_KEY, TEE_PUBLIC_KEY
+    global TEE_PRIVATE_KEY, TEE_PUBLIC_KEY, TEE_PUBLIC_KEY_PEM
+    global TEE_X25519_PRIVATE_KEY, TEE_X25519_PUBLIC_KEY_B64
+    global TEE_ED25519_PRIVATE_KEY, TEE_ED25519_PUBLIC_KEY_B64, _ATTESTATION_CACHE
+    
+    _ATTESTATION_CACHE = None
     
     key_dir = os.getenv('TEE_KEY_DIR', '/opt/tee-runtime')
     private_key_path = os.path.join(key_dir, 'tee_private_key.pem')
     public_key_path = os.path.join(key_dir, 'tee_public_key.pem')
+    x25519_key_path = os.path.join(key_dir, 'tee_x25519_private_key.pem')
+    ed25519_key_path = os.path.join(key_dir, 'tee_ed25519_private_key.pem')
     
     # Try to load existing keys
     if os.path.exists(private_key_path) and os.path.exists(public_key_path):
@@ -111,28 +219,119 @@ def load_tee_keypair():
         )
         TEE_PUBLIC_KEY = TEE_PRIVATE_KEY.public_key()
     
-    # Export public key for sharing
-    public_pem = TEE_PUBLIC_KEY.public_bytes(
+    TEE_X25519_PRIVATE_KEY = load_image_key(
+        x25519_key_path, x25519.X25519PrivateKey.generate, 'X25519'
+    )
+    TEE_ED25519_PRIVATE_KEY = load_image_key(
+        ed25519_key_path, ed25519.Ed25519PrivateKey.generate, 'Ed25519'
+    )
+    
+    # Export public keys for sharing
+    TEE_PUBLIC_KEY_PEM = TEE_PUBLIC_KEY.public_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PublicFormat.SubjectPublicKeyInfo
     ).decode('utf-8')
+    TEE_X25519_PUBLIC_KEY_B64 = raw_public_key_b64(TEE_X25519_PRIVATE_KEY)
+    TEE_ED25519_PUBLIC_KEY_B64 = raw_public_key_b64(TEE_ED25519_PRIVATE_KEY)
+    
+    return TEE_PUBLIC_KEY_PEM
+
+
+HTTP_SESSION_LOCK = threading.Lock()  # Guards creation of the shared HTTP sessions
+_METADATA_SESSION = None
+_CONTROL_PLANE_SESSION = None
+
+
+def make_http_session(max_retries):
+    """Keep-alive session with a small connection pool"""
+    import requests
+    from requests.adapters import HTTPAdapter
     
-    return public_pem
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=max_retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_metadata_session():
+    """
+    Shared session for metadata server lookups
+    
+    These don't retry: each lookup already has a timeout on the attestation
+    path, and get_instance_identity() backs off after a failed lookup.
+    """
+    global _METADATA_SESSION
+    if _METADATA_SESSION is None:
+        with HTTP_SESSION_LOCK:
+            if _METADATA_SESSION is None:
+                _METADATA_SESSION = make_http_session(max_retries=0)
+    return _METADATA_SESSION
+
+
+def get_control_plane_session():
+    """Shared session for control plane callbacks, retrying dropped connections"""
+    global _CONTROL_PLANE_SESSION
+    if _CONTROL_PLANE_SESSION is None:
+        with HTTP_SESSION_LOCK:
+            if _CONTROL_PLANE_SESSION is None:
+                from urllib3.util.retry import Retry
+                _CONTROL_PLANE_SESSION = make_http_session(
+                    max_retries=Retry(total=2, backoff_factor=0.1)
+                )
+    return _CONTROL_PLANE_SESSION
 
 
 def get_instance_metadata(key: str) -> Optional[str]:
     """Fetch metadata from GCP metadata server"""
     try:
-        import requests
         metadata_url = f"http://metadata.google.internal/computeMetadata/v1/{key}"
         headers = {"Metadata-Flavor": "Google"}
-        response = requests.get(metadata_url, headers=headers, timeout=2)
+        response = get_metadata_session().get(metadata_url, headers=headers, timeout=2)
         return response.text if response.status_code == 200 else None
     except Exception as e:
         logger.error(f"Failed to get metadata {key}: {e}")
         return None
 
 
+_INSTANCE_IDENTITY = None
+_PARTIAL_IDENTITY = None  # (time.monotonic() of the lookup, identity) after a failed lookup
+
+# Signed attestations are reused for this long, so polling clients don't each
+# cost an RSA signature. Clients see a generated_at at most this old.
+ATTESTATION_CACHE_SECONDS = int(os.getenv('TEE_ATTESTATION_CACHE_SECONDS', '60'))
+_ATTESTATION_CACHE = None  # (time.monotonic() when signed, serialized response body)
+
+
+def get_instance_identity() -> Dict[str, Optional[str]]:
+    """
+    Instance id, name and zone from the metadata server
+    
+    These never change for the lifetime of the VM, so they are cached once all
+    three lookups have succeeded. After a failed lookup (e.g. off GCP) the
+    partial identity is reused for ATTESTATION_CACHE_SECONDS before retrying.
+    """
+    global _INSTANCE_IDENTITY, _PARTIAL_IDENTITY
+    
+    if _INSTANCE_IDENTITY is not None:
+        return _INSTANCE_IDENTITY
+    
+    partial = _PARTIAL_IDENTITY
+    if partial is not None and time.monotonic() - partial[0] < ATTESTATION_CACHE_SECONDS:
+        return partial[1]
+    
+    identity = {
+        'instance_id': get_instance_metadata('instance/id'),
+        'instance_name': get_instance_metadata('instance/name'),
+        'zone': get_instance_metadata('instance/zone'),
+    }
+    if all(value is not None for value in identity.values()):
+        _INSTANCE_IDENTITY = identity
+    else:
+        _PARTIAL_IDENTITY = (time.monotonic(), identity)
+    return identity
+
+
 def calculate_code_measurement():
     """Calculate hash of this TEE server code"""
     global TEE_CODE_HASH, TEE_IMAGE_ID
@@ -184,25 +383,29 @@ def attestation():
     
     Clients MUST verify this before uploading data
     """
+    global _ATTESTATION_CACHE
+    
+    cached = _ATTESTATION_CACHE
+    if cached is not None and time.monotonic() - cached[0] < ATTESTATION_CACHE_SECONDS:
+        return Response(cached[1], mimetype='application/json')
+    
     try:
         # Get VM metadata for attestation
-        instance_id = get_instance_metadata('instance/id')
-        instance_name = get_instance_metadata('instance/name')
-        zone = get_instance_metadata('instance/zone')
+        identity = get_instance_identity()
+        generated_at = datetime.utcnow()
         
         attestation_data = {
             'tee_type': 'gcp_confidential_vm',
             'code_measurement': TEE_CODE_HASH,
             'image_id': TEE_IMAGE_ID,
-            'instance_id': instance_id,
-            'instance_name': instance_name,
-            'zone': zone,
-            'public_key': TEE_PUBLIC_KEY.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            ).decode('utf-8'),
-            'generated_at': datetime.utcnow().isoformat(),
-            'expires_at': (datetime.utcnow() + timedelta(hours=24)).isoformat(),
+            'instance_id': identity['instance_id'],
+            'instance_name': identity['instance_name'],
+            'zone': identity['zone'],
+            'public_key': TEE_PUBLIC_KEY_PEM,
+            'x25519_public_key': TEE_X25519_PUBLIC_KEY_B64,
+            'ed25519_public_key': TEE_ED25519_PUBLIC_KEY_B64,
+            'generated_at': generated_at.isoformat(),
+            'expires_at': (generated_at + timedelta(hours=24)).isoformat(),
             
             # Security properties
             'confidential_computing': True,
@@ -216,28 +419,388 @@ def attestation():
             # 'boot_measurements': [...],    # Measured boot chain
         }
         
-        # Sign attestation with TEE private key
-        attestation_json = json.dumps(attestation_data, sort_keys=True)
+        # Sign attestation with TEE private key. Verifiers rebuild the message with
+        # json.dumps(sort_keys=True), so this must stay on the stdlib encoder.
+        # Both signatures cover the same message; RSA stays until verifiers move
+        # to the much cheaper Ed25519 one.
+        attestation_message = json.dumps(attestation_data, sort_keys=True).encode('utf-8')
         signature = TEE_PRIVATE_KEY.sign(
-            attestation_json.encode('utf-8'),
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
+            attestation_message,
+            PSS_PADDING,
             hashes.SHA256()
         )
+        ed25519_signature = TEE_ED25519_PRIVATE_KEY.sign(attestation_message)
         
-        return jsonify({
-            'attestation': attestation_data,
-            'signature': base64.b64encode(signature).decode('utf-8'),
-            'signature_algorithm': 'RSA-PSS-SHA256'
-        })
+        # Embed the signed bytes as the 'attestation' value instead of serializing
+        # attestation_data a second time; parsing and re-dumping it with
+        # sort_keys=True gives back exactly the message that was signed
+        body = b''.join([
+            b'{"attestation":', attestation_message,
+            b',"signature":"', base64.b64encode(signature),
+            b'","signature_algorithm":"RSA-PSS-SHA256"',
+            b',"ed25519_signature":"', base64.b64encode(ed25519_signature),
+            b'"}'
+        ])
+        
+        # Only reuse attestations that carry the full instance identity
+        if _INSTANCE_IDENTITY is not None:
+            _ATTESTATION_CACHE = (time.monotonic(), body)
+        
+        return Response(body, mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Attestation generation failed: {e}")
         return jsonify({'error': 'Failed to generate attestation'}), 500
 
 
+def upload_storage_key(session_id: Optional[int]) -> Optional[bytes]:
+    """
+    Key to keep an encrypted copy of an upload under, or None when the session
+    database is its only copy. Session-less uploads always keep one.
+    """
+    if not session_id:
+        return AESGCM.generate_key(bit_length=256)
+    if PERSIST_DATASETS:
+        return get_or_create_session_key(session_id)
+    return None
+
+
+def decrypt_upload(
+    aes_key: bytes,
+    iv: bytes,
+    tag: bytes,
+    ciphertext_chunks,
+    plaintext_length: int,
+    storage_key: Optional[bytes] = None
+) -> Dict[str, Any]:
+    """
+    AES-GCM decrypt an upload chunk by chunk, doing all per-byte work on each
+    plaintext chunk while it is still in cache: SHA-256 checksum, UTF-8 check,
+    newline count and (given a storage_key) the storage re-encryption.
+    
+    Returns plaintext, checksum and newline_count, plus storage_key, storage_iv
+    and storage_encrypted when re-encrypting. Nothing is returned, and no
+    plaintext-dependent error is raised, unless the GCM tag verifies.
+    """
+    decryptor = Cipher(algorithms.AES(aes_key), modes.GCM(iv, tag)).decryptor()
+    checksum = hashlib.sha256()
+    utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+    utf8_valid = True
+    newline_count = 0
+    plaintext_chunks = []
+    
+    if storage_key is not None:
+        storage_iv = os.urandom(GCM_IV_LENGTH)
+        encryptor = Cipher(algorithms.AES(storage_key), modes.GCM(storage_iv)).encryptor()
+        # update_into needs room for one block beyond the input
+        storage_encrypted = bytearray(plaintext_length + 15 + GCM_TAG_LENGTH)
+        storage_view = memoryview(storage_encrypted)
+        written = 0
+    
+    for chunk in ciphertext_chunks:
+        plaintext_chunk = decryptor.update(chunk)
+        checksum.update(plaintext_chunk)
+        newline_count += plaintext_chunk.count(b'\n')
+        if utf8_valid:
+            try:
+                utf8_decoder.decode(plaintext_chunk)
+            except UnicodeDecodeError:
+                utf8_valid = False
+        if storage_key is not None:
+            written += encryptor.update_into(plaintext_chunk, storage_view[written:])
+        plaintext_chunks.append(plaintext_chunk)
+    
+    try:
+        decryptor.finalize()
+    except InvalidTag:
+        raise ValueError("Ciphertext failed authentication")
+    
+    # Only report on the plaintext once it is known to be authentic
+    if utf8_valid:
+        try:
+            utf8_decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            utf8_valid = False
+    if not utf8_valid:
+        raise ValueError("Dataset must be a valid UTF-8 encoded CSV file")
+    
+    upload = {
+        'plaintext': b''.join(plaintext_chunks),
+        'checksum': checksum.hexdigest(),
+        'newline_count': newline_count
+    }
+    
+    if storage_key is not None:
+        encryptor.finalize()  # GCM emits no trailing ciphertext, only the tag
+        storage_view.release()
+        del storage_encrypted[written:]
+        storage_encrypted += encryptor.tag
+        upload.update(
+            storage_key=storage_key,
+            storage_iv=storage_iv,
+            storage_encrypted=storage_encrypted
+        )
+    
+    return upload
+
+
+def open_csv_text(plaintext_data: bytes) -> io.TextIOWrapper:
+    """Read decrypted CSV bytes as text without decoding them all at once"""
+    return io.TextIOWrapper(io.BytesIO(plaintext_data), encoding='utf-8', newline='')
+
+
+def read_csv_header(plaintext_data: bytes, csv_text: io.TextIOWrapper) -> List[str]:
+    """
+    Validate that a CSV has a header and a data row and return the header
+    
+    Uses byte scans rather than csv.reader; only a header with quoted
+    fields (which may hold commas or newlines) goes through the csv module.
+    """
+    if not plaintext_data:
+        raise ValueError("CSV file is empty or malformed")
+    
+    header_end = plaintext_data.find(b'\n')
+    header_line = plaintext_data[:header_end if header_end != -1 else len(plaintext_data)]
+    if b'"' in header_line:
+        import csv
+        csv_reader = csv.reader(csv_text)
+        try:
+            header = next(csv_reader)
+            first_row = next(csv_reader, None)
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV format: {str(e)}")
+    else:
+        header_line = header_line.rstrip(b'\r')
+        header = header_line.decode('utf-8').split(',') if header_line else []
+        first_row = [] if header_end != -1 and header_end + 1 < len(plaintext_data) else None
+    
+    if not header:
+        raise ValueError("CSV file must have a header row")
+    if first_row is None:
+        raise ValueError("CSV file must contain at least one data row")
+    return header
+
+
+def store_dataset(
+    dataset_id: int,
+    session_id: Optional[int],
+    dataset_name: str,
+    upload: Dict[str, Any],
+    filename: str,
+    file_size: int,
+    background: bool = False
+) -> Dict[str, Any]:
+    """
+    Validate a decrypted CSV upload, load it and keep any re-encrypted copy
+    
+    Shared by /upload and /upload_stream with the result of decrypt_upload().
+    Returns the JSON body for the upload response. With background=True a
+    session upload is acknowledged once validated and loaded on INGEST_POOL;
+    the control plane is notified when it is available or has failed.
+    """
+    plaintext_data = upload['plaintext']
+    csv_text = open_csv_text(plaintext_data)
+    
+    header = read_csv_header(plaintext_data, csv_text)
+    logger.info(f"CSV validated: {len(header)} columns")
+    
+    if background and session_id:
+        with STATE_LOCK:
+            job = INGEST_POOL.submit(
+                ingest_in_background,
+                dataset_id, session_id, dataset_name, upload, csv_text, header, filename, file_size
+            )
+            INGEST_JOBS[dataset_id] = job
+            job.add_done_callback(functools.partial(record_ingest_outcome, dataset_id))
+        return {
+            'status': 'accepted',
+            'dataset_id': dataset_id,
+            'checksum': upload['checksum'],
+            'columns': header
+        }
+    
+    return finish_dataset(
+        dataset_id, session_id, dataset_name, upload, csv_text, header, filename, file_size
+    )
+
+
+def finish_dataset(
+    dataset_id: int,
+    session_id: Optional[int],
+    dataset_name: str,
+    upload: Dict[str, Any],
+    csv_text: io.TextIOWrapper,
+    header: List[str],
+    filename: str,
+    file_size: int
+) -> Dict[str, Any]:
+    """Load a validated upload into its session database and record it in DATASETS"""
+    plaintext_data = upload['plaintext']
+    
+    # Load if session exists
+    if session_id:
+        # Session-bound upload (Legacy flow)
+        # Load CSV into session's SQLite database, decoding as it goes
+        csv_text.seek(0)
+        load_result = QUERY_EXECUTOR.load_dataset(
+            session_id=session_id,
+            dataset_id=dataset_id,
+            dataset_name=dataset_name,
+            csv_content=csv_text
+        )
+        table_name = load_result['table_name']
+        row_count = load_result['row_count']
+    else:
+        # Independent upload
+        table_name = None
+        # Rows are the newlines counted during decryption, less any in
+        # trailing whitespace
+        end = len(plaintext_data)
+        while end and plaintext_data[end - 1] in b' \t\r\n':
+            end -= 1
+        row_count = upload['newline_count'] - plaintext_data.count(b'\n', end)
+    
+    # Store dataset metadata
+    dataset = {
+        'session_id': session_id,
+        'filename': filename,
+        'file_size': file_size,
+        'uploaded_at': datetime.utcnow().isoformat(),
+        'checksum': upload['checksum'],
+        'table_name': table_name,
+        'row_count': row_count,
+        'columns': header
+    }
+    
+    # Keep the copy re-encrypted with the storage key for backup/persistence
+    if 'storage_key' in upload:
+        dataset['encrypted_data'] = upload['storage_encrypted']
+        dataset['iv'] = upload['storage_iv']
+        dataset['storage_key'] = upload['storage_key']
+    
+    # Store and persist state, unless the session was closed while loading
+    with STATE_LOCK:
+        session_closed = session_id in CLOSED_SESSIONS
+        if not session_closed:
+            DATASETS[dataset_id] = dataset
+            INGEST_JOBS.pop(dataset_id, None)  # Supersedes any earlier failed ingest
+            save_datasets()
+    
+    if session_closed:
+        QUERY_EXECUTOR.delete_session_database(session_id)
+        raise ValueError(f"Session {session_id} was closed while dataset {dataset_id} was loading")
+    
+    return {
+        'status': 'success',
+        'dataset_id': dataset_id,
+        'checksum': dataset['checksum'],
+        'row_count': row_count,
+        'columns': header
+    }
+
+
+def ingest_in_background(
+    dataset_id: int,
+    session_id: int,
+    dataset_name: str,
+    upload: Dict[str, Any],
+    csv_text: io.TextIOWrapper,
+    header: List[str],
+    filename: str,
+    file_size: int
+) -> Dict[str, Any]:
+    """finish_dataset on INGEST_POOL, reporting the outcome to the control plane"""
+    try:
+        result = finish_dataset(
+            dataset_id, session_id, dataset_name, upload, csv_text, header, filename, file_size
+        )
+    except Exception as e:
+        logger.error(f"Background ingest of dataset {dataset_id} failed: {e}")
+        notify_control_plane(dataset_id, 'failed', {'error': str(e)})
+        raise
+    
+    notify_control_plane(dataset_id, 'available', {
+        'checksum': result['checksum'],
+        'file_size': file_size,
+        'row_count': result['row_count'],
+        'columns': result['columns']
+    })
+    return result
+
+
+def record_ingest_outcome(dataset_id: int, job: Future) -> None:
+    """
+    Replace a finished ingest Future in INGEST_JOBS with a small status record
+    
+    A failed Future's traceback still references the decrypted upload, so the
+    Future itself is dropped. Successful loads are reported from DATASETS.
+    """
+    error = job.exception()
+    with STATE_LOCK:
+        if INGEST_JOBS.get(dataset_id) is not job:
+            return  # Session closed or TEE reset while it was loading
+        if error is None:
+            del INGEST_JOBS[dataset_id]
+        else:
+            INGEST_JOBS[dataset_id] = {'status': 'failed', 'error': str(error)}
+
+
+def verify_upload_token(auth_header: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Check an upload's Bearer token before any body parsing or key unwrapping,
+    so unauthenticated requests never reach the RSA/X25519 work. Also checks
+    the control plane's session close tokens, signed with the same secret.
+    
+    Returns the token claims, or None when token checking isn't configured.
+    Raises PermissionError if the token is missing or invalid.
+    """
+    if not auth_header or not auth_header.startswith('Bearer '):
+        raise PermissionError('Missing authorization token')
+    
+    if not UPLOAD_TOKEN_SECRET:
+        return None
+    
+    import jwt
+    try:
+        return jwt.decode(auth_header[7:], UPLOAD_TOKEN_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError as e:
+        raise PermissionError(f'Invalid upload token: {e}')
+
+
+def upload_token_matches(claims: Optional[Dict[str, Any]], dataset_id, session_id) -> bool:
+    """Whether verified token claims were issued for this dataset and session"""
+    if claims is None:
+        return True
+    return (
+        str(claims.get('dataset_id')) == str(dataset_id)
+        and str(claims.get('session_id')) == str(session_id)
+    )
+
+
+def unwrap_upload_key(fields, iv: bytes) -> bytes:
+    """
+    Recover the AES-256-GCM key for an upload.
+    
+    Clients either send an ephemeral X25519 public key ("client_eph_pub"), from
+    which the key is derived with ECDH + HKDF-SHA256 (salt = IV), or the AES key
+    wrapped with the TEE's RSA key ("encrypted_key"). Raises ValueError (or
+    KeyError if neither is present) for key material that can't be used.
+    """
+    if fields.get('client_eph_pub'):
+        client_public_key = x25519.X25519PublicKey.from_public_bytes(
+            b64decode(fields['client_eph_pub'])
+        )
+        shared_secret = TEE_X25519_PRIVATE_KEY.exchange(client_public_key)
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=iv,
+            info=UPLOAD_HKDF_INFO
+        ).derive(shared_secret)
+    
+    return TEE_PRIVATE_KEY.decrypt(b64decode(fields['encrypted_key']), OAEP_PADDING)
+
+
 @app.route('/upload', methods=['POST'])
 def upload_dataset():
     """
@@ -249,134 +812,153 @@ def upload_dataset():
         "session_id": 456, # Optional
         "dataset_name": "customer_data",
         "encrypted_data": "base64...",  # AES-GCM encrypted CSV file
-        "encrypted_key": "base64...",    # RSA-OAEP encrypted AES key
+        "encrypted_key": "base64...",    # RSA-OAEP encrypted AES key, or
+        "client_eph_pub": "base64...",   # ephemeral X25519 public key (ECDH + HKDF)
         "iv": "base64...",
         "algorithm": "AES-256-GCM",
         "filename": "data.csv",
-        "file_size": 1024
+        "file_size": 1024,
+        "ingest": "async"                # Optional: 202 now, load in background
     }
     
     Note: Only CSV files with headers are supported.
+    Poll /datasets/<id>/status (or await the callback) after an async ingest.
     """
     try:
         # Verify upload token
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Missing authorization token'}), 401
-        
-        token = auth_header.split(' ')[1]
-        # In production, verify JWT against shared secret with control plane
-        # For demo, we'll accept it
+        try:
+            token_claims = verify_upload_token(request.headers.get('Authorization'))
+        except PermissionError as e:
+            return jsonify({'error': str(e)}), 401
         
         data = request.json
         dataset_id = data['dataset_id']
         session_id = data.get('session_id')
         dataset_name = data.get('dataset_name', f'dataset_{dataset_id}')
+        if not upload_token_matches(token_claims, dataset_id, session_id):
+            return jsonify({'error': 'Upload token was not issued for this dataset'}), 403
         
         logger.info(f"Receiving encrypted upload for dataset {dataset_id}, session {session_id}")
         
-        # Decrypt AES key using TEE private key
-        encrypted_key = base64.b64decode(data['encrypted_key'])
-        logger.info(f"Encrypted key length: {len(encrypted_key)} bytes (expected 512 for 4096-bit RSA)")
+        # Recover the AES key, then decrypt data with it
+        iv = b64decode(data['iv'])
+        try:
+            aes_key = unwrap_upload_key(data, iv)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': f'Invalid upload key: {e}'}), 400
         
-        aes_key = TEE_PRIVATE_KEY.decrypt(
-            encrypted_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        encrypted_data = b64decode(data['encrypted_data'])
         
-        # Decrypt data using AES key
-        encrypted_data = base64.b64decode(data['encrypted_data'])
-        iv = base64.b64decode(data['iv'])
+        if len(encrypted_data) < GCM_TAG_LENGTH:
+            raise ValueError("Ciphertext is too short")
+        ciphertext = memoryview(encrypted_data)[:-GCM_TAG_LENGTH]
+        upload = decrypt_upload(
+            aes_key,
+            iv,
+            encrypted_data[-GCM_TAG_LENGTH:],
+            (ciphertext[i:i + UPLOAD_CHUNK_SIZE] for i in range(0, len(ciphertext), UPLOAD_CHUNK_SIZE)),
+            len(ciphertext),
+            storage_key=upload_storage_key(session_id)
+        )
         
-        aesgcm = AESGCM(aes_key)
-        plaintext_data = aesgcm.decrypt(iv, encrypted_data, None)
+        logger.info(f"Successfully decrypted {len(upload['plaintext'])} bytes")
         
-        logger.info(f"Successfully decrypted {len(plaintext_data)} bytes")
+        result = store_dataset(
+            dataset_id=dataset_id,
+            session_id=session_id,
+            dataset_name=dataset_name,
+            upload=upload,
+            filename=data['filename'],
+            file_size=data['file_size'],
+            background=data.get('ingest') == 'async'
+        )
+        return jsonify(result), 202 if result['status'] == 'accepted' else 200
         
-        # Decode as CSV text
+    except Exception as e:
+        logger.error(f"Upload failed: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/upload_stream', methods=['POST'])
+def upload_dataset_stream():
+    """
+    Receive an encrypted dataset as a binary multipart upload
+    
+    Same as /upload without the base64 JSON body. Expected form fields:
+        dataset_id, session_id (optional), dataset_name (optional),
+        encrypted_key (base64 RSA-OAEP encrypted AES key) or client_eph_pub
+        (base64 ephemeral X25519 public key), filename, file_size, ingest (optional)
+    and a file part "ciphertext" holding IV (12 bytes) || AES-GCM ciphertext || tag (16 bytes).
+    
+    The ciphertext is decrypted and hashed in chunks as it is read. Nothing is
+    used until the GCM tag has been verified.
+    """
+    try:
+        # Verify upload token
         try:
-            csv_content = plaintext_data.decode('utf-8')
-        except UnicodeDecodeError:
-            raise ValueError("Dataset must be a valid UTF-8 encoded CSV file")
+            token_claims = verify_upload_token(request.headers.get('Authorization'))
+        except PermissionError as e:
+            return jsonify({'error': str(e)}), 401
+        
+        form = request.form
+        dataset_id = int(form['dataset_id'])
+        session_id = int(form['session_id']) if form.get('session_id') else None
+        dataset_name = form.get('dataset_name', f'dataset_{dataset_id}')
+        if not upload_token_matches(token_claims, dataset_id, session_id):
+            return jsonify({'error': 'Upload token was not issued for this dataset'}), 403
+        
+        logger.info(f"Receiving streamed upload for dataset {dataset_id}, session {session_id}")
+        
+        # Read the IV and tag from the ends of the part, then decrypt the middle
+        stream = request.files['ciphertext'].stream
+        total_length = stream.seek(0, os.SEEK_END)
+        if total_length < GCM_IV_LENGTH + GCM_TAG_LENGTH:
+            raise ValueError("Ciphertext is too short")
+        stream.seek(total_length - GCM_TAG_LENGTH)
+        tag = stream.read(GCM_TAG_LENGTH)
+        stream.seek(0)
+        iv = stream.read(GCM_IV_LENGTH)
         
-        # Validate CSV has header
-        import csv
-        import io
-        csv_reader = csv.reader(io.StringIO(csv_content))
         try:
-            header = next(csv_reader)
-            if not header or len(header) == 0:
-                raise ValueError("CSV file must have a header row")
-            
-            # Check for at least one data row
-            first_row = next(csv_reader, None)
-            if first_row is None:
-                raise ValueError("CSV file must contain at least one data row")
-                
-            logger.info(f"CSV validated: {len(header)} columns")
-        except StopIteration:
-            raise ValueError("CSV file is empty or malformed")
-        except csv.Error as e:
-            raise ValueError(f"Invalid CSV format: {str(e)}")
+            aes_key = unwrap_upload_key(form, iv)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': f'Invalid upload key: {e}'}), 400
         
-        # Determine storage key and load if session exists
-        if session_id:
-            # Session-bound upload (Legacy flow)
-            storage_key = get_or_create_session_key(session_id)
-            
-            # Load CSV into session's SQLite database
-            load_result = QUERY_EXECUTOR.load_dataset(
-                session_id=session_id,
-                dataset_id=dataset_id,
-                dataset_name=dataset_name,
-                csv_content=csv_content
-            )
-            table_name = load_result['table_name']
-            row_count = load_result['row_count']
-        else:
-            # Independent upload
-            storage_key = AESGCM.generate_key(bit_length=256)
-            table_name = None
-            # Recount rows (since iterator was consumed)
-            row_count = len(csv_content.strip().split('\n')) - 1
-        
-        # Re-encrypt with storage key for backup/persistence
-        storage_iv = os.urandom(12)
-        storage_aesgcm = AESGCM(storage_key)
-        storage_encrypted = storage_aesgcm.encrypt(storage_iv, plaintext_data, None)
-        
-        # Store encrypted dataset
-        DATASETS[dataset_id] = {
-            'session_id': session_id,
-            'encrypted_data': storage_encrypted,
-            'iv': storage_iv,
-            'storage_key': storage_key,
-            'filename': data['filename'],
-            'file_size': data['file_size'],
-            'uploaded_at': datetime.utcnow().isoformat(),
-            'checksum': hashlib.sha256(plaintext_data).hexdigest(),
-            'table_name': table_name,
-            'row_count': row_count,
-            'columns': header
-        }
+        ciphertext_length = total_length - GCM_IV_LENGTH - GCM_TAG_LENGTH
         
-        # Persist state
-        save_datasets()
+        def ciphertext_chunks():
+            remaining = ciphertext_length
+            while remaining:
+                chunk = stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("Ciphertext ended early")
+                remaining -= len(chunk)
+                yield chunk
         
-        return jsonify({
-            'status': 'success',
-            'dataset_id': dataset_id,
-            'checksum': DATASETS[dataset_id]['checksum'],
-            'row_count': row_count,
-            'columns': header
-        })
+        upload = decrypt_upload(
+            aes_key,
+            iv,
+            tag,
+            ciphertext_chunks(),
+            ciphertext_length,
+            storage_key=upload_storage_key(session_id)
+        )
+        
+        logger.info(f"Successfully decrypted {len(upload['plaintext'])} bytes")
+        
+        result = store_dataset(
+            dataset_id=dataset_id,
+            session_id=session_id,
+            dataset_name=dataset_name,
+            upload=upload,
+            filename=form.get('filename', ''),
+            file_size=int(form.get('file_size', len(upload['plaintext']))),
+            background=form.get('ingest') == 'async'
+        )
+        return jsonify(result), 202 if result['status'] == 'accepted' else 200
         
     except Exception as e:
-        logger.error(f"Upload failed: {str(e)}")
+        logger.error(f"Streamed upload failed: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -476,15 +1058,34 @@ def get_datasets_info():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/datasets/<int:dataset_id>/status', methods=['GET'])
+def dataset_status(dataset_id: int):
+    """Ingest status of an uploaded dataset: ingesting, available or failed"""
+    with STATE_LOCK:
+        job = INGEST_JOBS.get(dataset_id)
+        stored = dataset_id in DATASETS
+    
+    if isinstance(job, Future):
+        return jsonify({'dataset_id': dataset_id, 'status': 'ingesting'})
+    if job is not None:
+        return jsonify({'dataset_id': dataset_id, **job})
+    if stored:
+        return jsonify({'dataset_id': dataset_id, 'status': 'available'})
+    return jsonify({'error': 'Dataset not found'}), 404
+
+
 @app.route('/datasets/list', methods=['GET'])
 def list_all_datasets():
     """
     List all datasets currently loaded in the TEE
     """
     try:
-        logger.info(f"Listing all datasets. Current count: {len(DATASETS)}")
+        with STATE_LOCK:
+            datasets = list(DATASETS.items())
+        
+        logger.info(f"Listing all datasets. Current count: {len(datasets)}")
         result = {}
-        for dataset_id, dataset in DATASETS.items():
+        for dataset_id, dataset in datasets:
             result[dataset_id] = {
                 'file_size': dataset.get('file_size'),
                 'filename': dataset.get('filename'),
@@ -499,6 +1100,47 @@ def list_all_datasets():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/sessions/<int:session_id>/close', methods=['POST'])
+def close_session(session_id: int):
+    """
+    Release everything held for a finished collaboration session: its datasets,
+    session key and SQLite database
+    
+    When TEE_UPLOAD_TOKEN_SECRET is set, requires a control plane token for
+    this session with "action": "close_session"; upload tokens don't carry it.
+    """
+    if UPLOAD_TOKEN_SECRET:
+        try:
+            claims = verify_upload_token(request.headers.get('Authorization'))
+        except PermissionError as e:
+            return jsonify({'error': str(e)}), 401
+        if claims.get('action') != 'close_session' or str(claims.get('session_id')) != str(session_id):
+            return jsonify({'error': 'Token was not issued to close this session'}), 403
+    
+    try:
+        with STATE_LOCK:
+            dataset_ids = [
+                dataset_id for dataset_id, dataset in DATASETS.items()
+                if dataset.get('session_id') == session_id
+            ]
+            for dataset_id in dataset_ids:
+                del DATASETS[dataset_id]
+                INGEST_JOBS.pop(dataset_id, None)
+            SESSION_KEYS.pop(session_id, None)
+            CLOSED_SESSIONS.add(session_id)
+            save_datasets()
+        
+        if QUERY_EXECUTOR:
+            QUERY_EXECUTOR.delete_session_database(session_id)
+        
+        logger.info(f"Closed session {session_id}, released {len(dataset_ids)} datasets")
+        return jsonify({'status': 'success', 'released_datasets': dataset_ids})
+        
+    except Exception as e:
+        logger.error(f"Failed to close session {session_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/admin/reset', methods=['POST'])
 def reset_tee():
     """
@@ -506,20 +1148,20 @@ def reset_tee():
     WARNING: This deletes all data!
     """
     try:
-        # Clear in-memory state
-        DATASETS.clear()
-        SESSION_KEYS.clear()
-        
-        # Clear persisted state
-        if os.path.exists(DATASETS_FILE):
-            os.remove(DATASETS_FILE)
+        with STATE_LOCK:
+            # Clear in-memory state
+            DATASETS.clear()
+            SESSION_KEYS.clear()
+            INGEST_JOBS.clear()
+            CLOSED_SESSIONS.clear()
+            
+            # Clear persisted state
+            if os.path.exists(DATASETS_FILE):
+                os.remove(DATASETS_FILE)
             
         # Clear SQLite databases
         if QUERY_EXECUTOR:
-            import shutil
-            if os.path.exists(QUERY_EXECUTOR.data_dir):
-                shutil.rmtree(QUERY_EXECUTOR.data_dir)
-                os.makedirs(QUERY_EXECUTOR.data_dir)
+            QUERY_EXECUTOR.reset()
         
         logger.warning("TEE state has been reset!")
         return jsonify({'status': 'success', 'message': 'TEE state reset complete'})
@@ -531,17 +1173,18 @@ def reset_tee():
 
 def get_or_create_session_key(session_id: int) -> bytes:
     """Generate or retrieve session-specific encryption key"""
-    if session_id not in SESSION_KEYS:
-        SESSION_KEYS[session_id] = AESGCM.generate_key(bit_length=256)
-        logger.info(f"Generated new session key for session {session_id}")
-    return SESSION_KEYS[session_id]
+    # Two uploads racing here must not end up with different keys for one session
+    with STATE_LOCK:
+        if session_id not in SESSION_KEYS:
+            SESSION_KEYS[session_id] = AESGCM.generate_key(bit_length=256)
+            logger.info(f"Generated new session key for session {session_id}")
+        return SESSION_KEYS[session_id]
 
 
 def notify_control_plane(entity_id: int, status: str, metadata: Dict[str, Any], is_query: bool = False):
     """Notify control plane of dataset/query status changes"""
     try:
-        import requests
-        
+        session = get_control_plane_session()
         endpoint = f"{CONTROL_PLANE_URL}/api/tee/callback"
         payload = {
             'entity_type': 'query' if is_query else 'dataset',
@@ -552,7 +1195,15 @@ def notify_control_plane(entity_id: int, status: str, metadata: Dict[str, Any],
         }
         
         # In production, sign this callback with TEE private key
-        response = requests.post(endpoint, json=payload, timeout=5)
+        if orjson is not None:
+            response = session.post(
+                endpoint,
+                data=orjson.dumps(payload),
+                headers={'Content-Type': 'application/json'},
+                timeout=5
+            )
+        else:
+            response = session.post(endpoint, json=payload, timeout=5)
         response.raise_for_status()
         logger.info(f"Notified control plane: {status} for {'query' if is_query else 'dataset'} {entity_id}")
         
@@ -570,17 +1221,18 @@ def save_datasets():
     """Persist datasets to disk (simulated sealed storage)"""
     try:
         # Convert bytes to base64 for JSON serialization
-        serializable_datasets = {}
-        for k, v in DATASETS.items():
-            serializable_datasets[str(k)] = v.copy()
-            # Handle bytes
-            for key in ['encrypted_data', 'iv', 'storage_key']:
-                if key in serializable_datasets[str(k)] and isinstance(serializable_datasets[str(k)][key], bytes):
-                    serializable_datasets[str(k)][key] = base64.b64encode(serializable_datasets[str(k)][key]).decode('utf-8')
-        
-        with open(DATASETS_FILE, 'w') as f:
-            json.dump(serializable_datasets, f, indent=2)
-        logger.info(f"Saved {len(DATASETS)} datasets to {DATASETS_FILE}")
+        with STATE_LOCK:
+            serializable_datasets = {}
+            for k, v in DATASETS.items():
+                serializable_datasets[str(k)] = v.copy()
+                # Handle bytes
+                for key in ['encrypted_data', 'iv', 'storage_key']:
+                    if key in serializable_datasets[str(k)] and isinstance(serializable_datasets[str(k)][key], (bytes, bytearray)):
+                        serializable_datasets[str(k)][key] = base64.b64encode(serializable_datasets[str(k)][key]).decode('utf-8')
+            
+            with open(DATASETS_FILE, 'w') as f:
+                json.dump(serializable_datasets, f, indent=2)
+            logger.info(f"Saved {len(serializable_datasets)} datasets to {DATASETS_FILE}")
     except Exception as e:
         logger.error(f"Failed to save datasets: {e}")
 
@@ -637,11 +1289,17 @@ if __name__ == '__main__':
     logger.info("   3. Verify attestation signature before uploading data")
     logger.info("=" * 80)
     
-    # Start server
+    # Start server (debug mode is never enabled in the TEE)
     port = int(os.getenv('TEE_PORT', 8080))
-    app.run(
-        host='0.0.0.0',
-        port=port,
-        debug=False,  # Never enable debug in production TEE
-        threaded=True
-    )
+    if serve is not None:
+        threads = int(os.getenv('TEE_THREADS', (os.cpu_count() or 1) * 2))
+        logger.info(f"Serving with waitress on port {port} ({threads} threads)")
+        serve(app, host='0.0.0.0', port=port, threads=threads)
+    else:
+        logger.warning("waitress not installed; falling back to the Werkzeug server")
+        app.run(
+            host='0.0.0.0',
+            port=port,
+            debug=False,
+            threaded=True
+        )
@@ -0,0 +1,50 @@
+"""
+Pytest configuration and fixtures for the TEE worker
+"""
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa, x25519
+
+import tee_server
+from query_executor import QueryExecutor
+
+
+@pytest.fixture
+def notifications(monkeypatch):
+    """Control-plane callbacks as (entity_id, status) pairs, recorded instead of sent"""
+    sent = []
+    monkeypatch.setattr(
+        tee_server, 'notify_control_plane',
+        lambda entity_id, status, metadata, is_query=False: sent.append((entity_id, status))
+    )
+    return sent
+
+
+@pytest.fixture(scope='session')
+def tee_keys():
+    """RSA and X25519 private keys for the TEE, generated once per test session"""
+    return {
+        'rsa': rsa.generate_private_key(public_exponent=65537, key_size=2048),
+        'x25519': x25519.X25519PrivateKey.generate()
+    }
+
+
+@pytest.fixture
+def tee(tmp_path, monkeypatch, notifications, tee_keys):
+    """The tee_server module with fresh keys and state, and SQLite databases under tmp_path"""
+    monkeypatch.setattr(tee_server, 'TEE_PRIVATE_KEY', tee_keys['rsa'])
+    monkeypatch.setattr(tee_server, 'TEE_PUBLIC_KEY', tee_keys['rsa'].public_key())
+    monkeypatch.setattr(tee_server, 'TEE_X25519_PRIVATE_KEY', tee_keys['x25519'])
+    monkeypatch.setattr(tee_server, 'UPLOAD_TOKEN_SECRET', None)
+    monkeypatch.setattr(tee_server, 'QUERY_EXECUTOR', QueryExecutor(data_dir=str(tmp_path / 'data')))
+    monkeypatch.setattr(tee_server, 'DATASETS_FILE', str(tmp_path / 'tee_datasets.json'))
+    monkeypatch.setattr(tee_server, 'DATASETS', {})
+    monkeypatch.setattr(tee_server, 'SESSION_KEYS', {})
+    monkeypatch.setattr(tee_server, 'INGEST_JOBS', {})
+    monkeypatch.setattr(tee_server, 'CLOSED_SESSIONS', set())
+    return tee_server
+
+
+@pytest.fixture
+def client(tee):
+    """Create a test client for the TEE server"""
+    return tee.app.test_client()
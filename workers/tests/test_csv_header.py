@@ -0,0 +1,40 @@
+"""
+Tests for CSV header validation of decrypted uploads
+"""
+import pytest
+
+import tee_server
+
+
+def read_header(plaintext):
+    """Validate plaintext the way store_dataset() does"""
+    return tee_server.read_csv_header(plaintext, tee_server.open_csv_text(plaintext))
+
+
+class TestReadCsvHeader:
+    """Test suite for read_csv_header"""
+    
+    @pytest.mark.parametrize('plaintext, header', [
+        (b'a,b\n1,2\n', ['a', 'b']),
+        (b'a,b\r\n1,2\r\n', ['a', 'b']),
+        (b'a, b ,\n1,2,3\n', ['a', ' b ', '']),
+        (b'a,b\n\n', ['a', 'b']),
+        (b'"x,y",b\n1,2\n', ['x,y', 'b']),
+        (b'"x\ny",b\n1,2\n', ['x\ny', 'b']),
+    ])
+    def test_valid_header(self, plaintext, header):
+        """Test that the header is returned as csv.reader would parse it"""
+        assert read_header(plaintext) == header
+    
+    @pytest.mark.parametrize('plaintext, error', [
+        (b'', 'empty'),
+        (b'a,b', 'at least one data row'),
+        (b'a,b\n', 'at least one data row'),
+        (b'a,b\r\n', 'at least one data row'),
+        (b'"x\ny",b\n', 'at least one data row'),
+        (b'\n1,2\n', 'header row'),
+    ])
+    def test_invalid_csv(self, plaintext, error):
+        """Test that empty, header-only and headerless uploads are rejected"""
+        with pytest.raises(ValueError, match=error):
+            read_header(plaintext)
@@ -0,0 +1,68 @@
+"""
+Tests for the fused decrypt loop used by /upload and /upload_stream
+"""
+import hashlib
+import os
+
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+import tee_server
+
+
+# Multi-byte characters land on chunk boundaries with 5-byte chunks
+CSV = 'name,city\nJosé,Zürich\nŁucja,Kraków\n'.encode('utf-8')
+
+
+def decrypt(plaintext, tamper=False, chunk_size=5, storage_key=None):
+    """Encrypt plaintext as a client would, then run it through decrypt_upload()"""
+    key = AESGCM.generate_key(bit_length=256)
+    iv = os.urandom(12)
+    sealed = bytearray(AESGCM(key).encrypt(iv, plaintext, None))
+    if tamper:
+        sealed[-1] ^= 1
+    ciphertext, tag = bytes(sealed[:-16]), bytes(sealed[-16:])
+    chunks = (ciphertext[i:i + chunk_size] for i in range(0, len(ciphertext), chunk_size))
+    return tee_server.decrypt_upload(key, iv, tag, chunks, len(ciphertext), storage_key=storage_key)
+
+
+class TestDecryptUpload:
+    """Test suite for decrypt_upload"""
+    
+    def test_plaintext_checksum_and_newlines(self):
+        """Test the plaintext, SHA-256 and newline count gathered while decrypting"""
+        upload = decrypt(CSV)
+        
+        assert upload['plaintext'] == CSV
+        assert upload['checksum'] == hashlib.sha256(CSV).hexdigest()
+        assert upload['newline_count'] == 3
+        assert 'storage_key' not in upload
+    
+    def test_tampered_tag_is_rejected(self):
+        """Test that a modified tag fails authentication"""
+        with pytest.raises(ValueError, match='failed authentication'):
+            decrypt(CSV, tamper=True)
+    
+    def test_invalid_utf8_after_tag_check(self):
+        """Test that invalid UTF-8 is reported only for authentic ciphertext"""
+        plaintext = b'a,b\n\xff,2\n'
+        
+        with pytest.raises(ValueError, match='failed authentication'):
+            decrypt(plaintext, tamper=True)
+        with pytest.raises(ValueError, match='UTF-8'):
+            decrypt(plaintext)
+    
+    def test_truncated_utf8_is_rejected(self):
+        """Test that a multi-byte character cut off at the end is caught"""
+        with pytest.raises(ValueError, match='UTF-8'):
+            decrypt(CSV + 'é'.encode('utf-8')[:1])
+    
+    def test_storage_copy_round_trips(self):
+        """Test that the re-encrypted storage copy decrypts to the plaintext"""
+        storage_key = AESGCM.generate_key(bit_length=256)
+        upload = decrypt(CSV, storage_key=storage_key)
+        
+        assert upload['storage_key'] == storage_key
+        assert AESGCM(storage_key).decrypt(
+            upload['storage_iv'], bytes(upload['storage_encrypted']), None
+        ) == CSV
@@ -0,0 +1,94 @@
+"""
+Tests for background dataset ingest
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+
+
+CSV = b'a,b\n1,2\n3,4\n'
+
+
+def make_upload(plaintext=CSV):
+    """A decrypted upload as returned by decrypt_upload()"""
+    return {
+        'plaintext': plaintext,
+        'checksum': hashlib.sha256(plaintext).hexdigest(),
+        'newline_count': plaintext.count(b'\n')
+    }
+
+
+def wait_for_ingest(client, dataset_id, timeout=5):
+    """Poll /datasets/<id>/status until the background load has finished"""
+    deadline = time.monotonic() + timeout
+    while True:
+        body = client.get(f'/datasets/{dataset_id}/status').get_json()
+        if body.get('status') != 'ingesting' or time.monotonic() > deadline:
+            return body
+        time.sleep(0.01)
+
+
+class TestBackgroundIngest:
+    """Test suite for uploads acknowledged before their SQLite load"""
+    
+    def test_successful_ingest_is_available(self, tee, client, notifications):
+        """Test that a finished load is reported from DATASETS and its job dropped"""
+        result = tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV), background=True)
+        assert result['status'] == 'accepted'
+        
+        assert wait_for_ingest(client, 1) == {'dataset_id': 1, 'status': 'available'}
+        assert 1 not in tee.INGEST_JOBS
+        assert tee.DATASETS[1]['row_count'] == 2
+        assert notifications == [(1, 'available')]
+    
+    def test_failed_ingest_reports_failed(self, tee, client, notifications):
+        """Test that a failed load keeps only its error, not the Future"""
+        tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV))
+        
+        # Loading the same dataset into the session again fails in the executor
+        tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV), background=True)
+        
+        body = wait_for_ingest(client, 1)
+        assert body['status'] == 'failed'
+        assert 'already exists' in body['error']
+        assert tee.INGEST_JOBS[1] == {'status': 'failed', 'error': body['error']}
+        assert not any(isinstance(job, Future) for job in tee.INGEST_JOBS.values())
+        assert notifications == [(1, 'failed')]
+    
+    def test_sync_upload_supersedes_failed_ingest(self, tee, client):
+        """Test that a later successful load replaces a failed job's status"""
+        tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV))
+        tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV), background=True)
+        assert wait_for_ingest(client, 1)['status'] == 'failed'
+        
+        tee.QUERY_EXECUTOR.delete_session_database(7)
+        tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV))
+        
+        assert client.get('/datasets/1/status').get_json() == {'dataset_id': 1, 'status': 'available'}
+        assert 1 not in tee.INGEST_JOBS
+    
+    def test_session_closed_during_ingest(self, tee, client, notifications, monkeypatch):
+        """Test that a load finishing after its session was closed is dropped"""
+        loading = threading.Event()
+        closed = threading.Event()
+        load_dataset = tee.QUERY_EXECUTOR.load_dataset
+        
+        def load_after_close(**kwargs):
+            loading.set()
+            closed.wait(5)
+            return load_dataset(**kwargs)
+        
+        monkeypatch.setattr(tee.QUERY_EXECUTOR, 'load_dataset', load_after_close)
+        
+        tee.store_dataset(1, 7, 'scores', make_upload(), 'scores.csv', len(CSV), background=True)
+        job = tee.INGEST_JOBS[1]
+        assert loading.wait(5)
+        assert client.post('/sessions/7/close').status_code == 200
+        closed.set()
+        
+        assert 'was closed' in str(job.exception(5))
+        assert 1 not in tee.DATASETS
+        assert wait_for_ingest(client, 1)['status'] == 'failed'
+        assert not tee.QUERY_EXECUTOR._get_db_path(7).exists()
+        assert (1, 'available') not in notifications
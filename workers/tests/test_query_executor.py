@@ -0,0 +1,108 @@
+"""
+Tests for the SQLite query executor
+"""
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+import query_executor
+from query_executor import QueryExecutor
+
+
+@pytest.fixture
+def executor(tmp_path):
+    """A query executor with a session database holding one dataset"""
+    executor = QueryExecutor(data_dir=str(tmp_path))
+    executor.load_dataset(7, 1, 'scores', 'a,b\n1,2\n')
+    return executor
+
+
+class TestSessionSchema:
+    """Test suite for the cached session schema"""
+    
+    def test_schema_is_returned_as_copy(self, executor):
+        """Test that mutating a returned schema doesn't change the cached one"""
+        executor.get_session_schema(7)['tables'].clear()
+        executor.get_session_schema(7)['tables'][0]['columns'].clear()
+        
+        schema = executor.get_session_schema(7)
+        assert len(schema['tables']) == 1
+        assert [c['name'] for c in schema['tables'][0]['columns']] == ['a', 'b']
+    
+    def test_schema_read_during_load_is_not_cached(self, executor):
+        """Test that a schema read before a concurrent load isn't stored afterwards"""
+        reader = executor._reader
+        
+        @contextmanager
+        def reader_then_load(session_id):
+            with reader(session_id) as conn:
+                yield conn
+            executor.load_dataset(7, 2, 'payments', 'c\n3\n')
+        
+        executor._reader = reader_then_load
+        stale = executor.get_session_schema(7)
+        executor._reader = reader
+        
+        assert len(stale['tables']) == 1
+        assert len(executor.get_session_schema(7)['tables']) == 2
+    
+    def test_schema_cache_is_bounded(self, executor, monkeypatch):
+        """Test that the least recently used schema is evicted past the limit"""
+        monkeypatch.setattr(query_executor, 'MAX_CACHED_SCHEMAS', 2)
+        executor.load_dataset(8, 2, 'payments', 'c\n3\n')
+        executor.load_dataset(9, 3, 'rents', 'd\n4\n')
+        
+        executor.get_session_schema(7)
+        executor.get_session_schema(8)
+        executor.get_session_schema(7)
+        executor.get_session_schema(9)
+        
+        assert list(executor._schema_cache) == [7, 9]
+        assert set(executor._schema_generation) == {7, 9}
+    
+    def test_delete_forgets_session(self, executor):
+        """Test that deleting a session database leaves no cached schema state"""
+        executor.get_session_schema(7)
+        executor.delete_session_database(7)
+        
+        assert 7 not in executor._schema_cache
+        assert 7 not in executor._schema_generation
+        assert executor.get_session_schema(7) == {'tables': []}
+
+
+class TestReaderPool:
+    """Test suite for pooled read-only connections"""
+    
+    def test_idle_readers_are_capped_globally(self, executor, monkeypatch):
+        """Test that the least recently used session's readers are closed past the cap"""
+        monkeypatch.setattr(query_executor, 'MAX_TOTAL_IDLE_READERS', 2)
+        executor.load_dataset(8, 2, 'payments', 'c\n3\n')
+        executor.load_dataset(9, 3, 'rents', 'd\n4\n')
+        
+        for session_id in (7, 8, 9):
+            with executor._reader(session_id):
+                pass
+        
+        assert list(executor._idle_readers) == [8, 9]
+        assert executor._idle_reader_count == 2
+    
+    def test_delete_closes_readers(self, executor):
+        """Test that deleting a session database closes its pooled readers"""
+        with executor._reader(7) as conn:
+            pass
+        executor.delete_session_database(7)
+        
+        assert 7 not in executor._idle_readers
+        assert 7 not in executor._reader_generation
+        assert executor._idle_reader_count == 0
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+    
+    def test_reader_checked_out_during_delete_is_closed(self, executor):
+        """Test that a reader returned after its session was deleted isn't pooled"""
+        with executor._reader(7) as conn:
+            executor.delete_session_database(7)
+        
+        assert 7 not in executor._idle_readers
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
@@ -0,0 +1,59 @@
+"""
+Tests for releasing a closed session's state
+"""
+import time
+
+import jwt
+import pytest
+
+
+SECRET = 'control-plane-secret-for-upload-tokens'
+
+
+def token(**claims):
+    """An HS256 token signed with the control plane's secret"""
+    return jwt.encode({'exp': int(time.time()) + 60, **claims}, SECRET, algorithm='HS256')
+
+
+class TestCloseSession:
+    """Test suite for /sessions/<id>/close"""
+    
+    @pytest.fixture
+    def dataset(self, tee):
+        """A dataset held for session 7"""
+        tee.DATASETS[1] = {'session_id': 7}
+        return 1
+    
+    def test_close_without_secret(self, tee, client, dataset):
+        """Test that closing needs no token when token checking isn't configured"""
+        response = client.post('/sessions/7/close')
+        
+        assert response.status_code == 200
+        assert response.get_json()['released_datasets'] == [dataset]
+        assert 7 in tee.CLOSED_SESSIONS
+    
+    @pytest.mark.parametrize('headers, status', [
+        ({}, 401),
+        ({'Authorization': 'Bearer not-a-token'}, 401),
+        ({'Authorization': f'Bearer {token(dataset_id=1, session_id=7)}'}, 403),
+        ({'Authorization': f'Bearer {token(action="close_session", session_id=8)}'}, 403),
+    ])
+    def test_close_requires_close_token(self, tee, client, dataset, monkeypatch, headers, status):
+        """Test that upload tokens and tokens for other sessions can't close a session"""
+        monkeypatch.setattr(tee, 'UPLOAD_TOKEN_SECRET', SECRET)
+        
+        response = client.post('/sessions/7/close', headers=headers)
+        
+        assert response.status_code == status
+        assert dataset in tee.DATASETS
+        assert 7 not in tee.CLOSED_SESSIONS
+    
+    def test_close_with_close_token(self, tee, client, dataset, monkeypatch):
+        """Test that the control plane's close token releases the session"""
+        monkeypatch.setattr(tee, 'UPLOAD_TOKEN_SECRET', SECRET)
+        headers = {'Authorization': f'Bearer {token(action="close_session", session_id=7)}'}
+        
+        response = client.post('/sessions/7/close', headers=headers)
+        
+        assert response.status_code == 200
+        assert dataset not in tee.DATASETS
@@ -0,0 +1,152 @@
+"""
+Tests for encrypted dataset uploads
+"""
+import base64
+import hashlib
+import os
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+
+CSV = b'a,b\n1,2\n3,4\n'
+
+
+def b64(data):
+    """Base64 text as sent in upload payloads"""
+    return base64.b64encode(data).decode()
+
+
+def upload_payload(key, iv, **fields):
+    """A /upload body carrying CSV encrypted with key"""
+    return {
+        'dataset_id': 1,
+        'session_id': None,
+        'encrypted_data': b64(AESGCM(key).encrypt(iv, CSV, None)),
+        'iv': b64(iv),
+        'filename': 'scores.csv',
+        'file_size': len(CSV),
+        **fields
+    }
+
+
+def post_upload(client, payload, token='dev-token'):
+    """POST an upload with a Bearer token"""
+    return client.post('/upload', json=payload, headers={'Authorization': f'Bearer {token}'})
+
+
+class TestUploadKeys:
+    """Test suite for recovering an upload's AES key"""
+    
+    def test_x25519_key_agreement(self, tee, client):
+        """Test that a key derived with ECDH + HKDF(salt=iv, info=b'tee-upload') decrypts"""
+        client_key = x25519.X25519PrivateKey.generate()
+        iv = os.urandom(12)
+        shared_secret = client_key.exchange(tee.TEE_X25519_PRIVATE_KEY.public_key())
+        key = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=iv, info=b'tee-upload'
+        ).derive(shared_secret)
+        client_public_key = client_key.public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw
+        )
+        
+        response = post_upload(client, upload_payload(key, iv, client_eph_pub=b64(client_public_key)))
+        
+        assert response.status_code == 200
+        assert response.get_json()['checksum'] == hashlib.sha256(CSV).hexdigest()
+        assert tee.DATASETS[1]['row_count'] == 2
+    
+    def test_rsa_wrapped_key(self, tee, client):
+        """Test that an AES key wrapped with RSA-OAEP still decrypts"""
+        key = AESGCM.generate_key(bit_length=256)
+        iv = os.urandom(12)
+        encrypted_key = tee.TEE_PUBLIC_KEY.encrypt(key, tee.OAEP_PADDING)
+        
+        response = post_upload(client, upload_payload(key, iv, encrypted_key=b64(encrypted_key)))
+        
+        assert response.status_code == 200
+        assert response.get_json()['checksum'] == hashlib.sha256(CSV).hexdigest()
+    
+    def test_malformed_client_key(self, tee, client):
+        """Test that a client public key of the wrong size is rejected with 400"""
+        key = AESGCM.generate_key(bit_length=256)
+        iv = os.urandom(12)
+        
+        response = post_upload(client, upload_payload(key, iv, client_eph_pub=b64(b'too short')))
+        
+        assert response.status_code == 400
+        assert 'Invalid upload key' in response.get_json()['error']
+        assert 1 not in tee.DATASETS
+
+
+class TestUploadTokens:
+    """Test suite for the control plane's upload tokens"""
+    
+    SECRET = 'control-plane-secret-for-upload-tokens'
+    
+    @pytest.fixture
+    def unwrap_calls(self, tee, monkeypatch):
+        """Require signed tokens and record every key unwrap"""
+        monkeypatch.setattr(tee, 'UPLOAD_TOKEN_SECRET', self.SECRET)
+        calls = []
+        unwrap_upload_key = tee.unwrap_upload_key
+        
+        def recording_unwrap(fields, iv):
+            calls.append(fields)
+            return unwrap_upload_key(fields, iv)
+        
+        monkeypatch.setattr(tee, 'unwrap_upload_key', recording_unwrap)
+        return calls
+    
+    def token(self, secret=SECRET, **claims):
+        """An HS256 upload token for dataset 1 outside any session"""
+        claims = {'dataset_id': 1, 'session_id': None, 'exp': int(time.time()) + 60, **claims}
+        return jwt.encode(claims, secret, algorithm='HS256')
+    
+    def payload(self, tee):
+        """An RSA-wrapped upload for dataset 1"""
+        key = AESGCM.generate_key(bit_length=256)
+        iv = os.urandom(12)
+        return upload_payload(key, iv, encrypted_key=b64(tee.TEE_PUBLIC_KEY.encrypt(key, tee.OAEP_PADDING)))
+    
+    def test_valid_token(self, tee, client, unwrap_calls):
+        """Test that a token issued for the dataset is accepted"""
+        response = post_upload(client, self.payload(tee), token=self.token())
+        
+        assert response.status_code == 200
+        assert len(unwrap_calls) == 1
+    
+    def test_missing_token(self, tee, client, unwrap_calls):
+        """Test that an upload without a token is rejected before key unwrapping"""
+        response = client.post('/upload', json=self.payload(tee))
+        
+        assert response.status_code == 401
+        assert unwrap_calls == []
+    
+    def test_bad_signature(self, tee, client, unwrap_calls):
+        """Test that a token signed with another secret is rejected"""
+        response = post_upload(client, self.payload(tee), token=self.token(secret='forged-secret-of-the-same-length!!!'))
+        
+        assert response.status_code == 401
+        assert unwrap_calls == []
+    
+    def test_expired_token(self, tee, client, unwrap_calls):
+        """Test that an expired token is rejected"""
+        response = post_upload(client, self.payload(tee), token=self.token(exp=int(time.time()) - 60))
+        
+        assert response.status_code == 401
+        assert unwrap_calls == []
+    
+    @pytest.mark.parametrize('claims', [{'dataset_id': 2}, {'session_id': 7}])
+    def test_token_for_other_upload(self, tee, client, unwrap_calls, claims):
+        """Test that a token issued for another dataset or session is rejected with 403"""
+        response = post_upload(client, self.payload(tee), token=self.token(**claims))
+        
+        assert response.status_code == 403
+        assert unwrap_calls == []
+        assert 1 not in tee.DATASETS